@@ -19,8 +19,16 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from ludo.db import Base
+import ludo.auth  # noqa: F401  (registers User and Page)
+import ludo.pages.changes  # noqa: F401
+import ludo.pages.links  # noqa: F401
 target_metadata = Base.metadata
 
+
+def include_name(name, type_, parent_names) -> bool:
+    # The full-text index is managed by ludo.pages.search, not migrations.
+    return not (type_ == "table" and name.startswith("page_fts"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -45,6 +53,8 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
+        render_as_batch=True,
     )
 
     with context.begin_transaction():
@@ -58,6 +68,12 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # ludo.db.run_migrations passes in the app's own connection.
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        configure_and_run(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
@@ -65,12 +81,20 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+        configure_and_run(connection)
+
+
+def configure_and_run(connection) -> None:
+    # SQLite can't alter most things in place; batch mode recreates tables.
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        render_as_batch=True,
+    )
 
-        with context.begin_transaction():
-            context.run_migrations()
+    with context.begin_transaction():
+        context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,156 @@
+"""Page paths and revisions, delta-compressed versions, change feed
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ludo.pages import delta
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+# "/" separates path segments, so titles lose theirs (as Page.slugify
+# drops it) before any path is built from them.
+STRIP_TITLE_SLASHES = "UPDATE page SET title = replace(title, '/', '') WHERE title LIKE '%/%'"
+
+# Pages whose parent no longer exists become roots.
+DETACH_ORPHANS = """
+    UPDATE page SET parent_id = NULL
+    WHERE parent_id IS NOT NULL AND parent_id NOT IN (SELECT id FROM page)
+"""
+
+# So does anything still unreachable from a root (a parent cycle and what
+# hangs off it), with "-<id>" appended to its title to keep it apart from
+# the roots already there.
+DETACH_CYCLES = """
+    UPDATE page SET parent_id = NULL, title = title || '-' || id
+    WHERE id NOT IN (
+        WITH RECURSIVE reachable(id) AS (
+            SELECT id FROM page WHERE parent_id IS NULL
+            UNION
+            SELECT page.id FROM page JOIN reachable ON page.parent_id = reachable.id
+        )
+        SELECT id FROM reachable
+    )
+"""
+
+# A sibling that repeats an earlier sibling's title gets "-<id>" appended,
+# so every path is unique and its last segment is still the page's title.
+DEDUPE_SIBLING_TITLES = """
+    UPDATE page SET title = title || '-' || id
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY author_id, parent_id, title ORDER BY id
+            ) AS n
+            FROM page
+        )
+        WHERE n > 1
+    )
+"""
+
+BACKFILL_PATHS = """
+    WITH RECURSIVE paths(id, path) AS (
+        SELECT id, '/' || title FROM page WHERE parent_id IS NULL
+        UNION ALL
+        SELECT page.id, paths.path || '/' || page.title
+        FROM page JOIN paths ON page.parent_id = paths.id
+    )
+    UPDATE page SET path = (SELECT path FROM paths WHERE paths.id = page.id)
+"""
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    op.add_column('page', sa.Column('path', sa.String(), nullable=True))
+    op.add_column(
+        'page', sa.Column('revision', sa.Integer(), nullable=False, server_default='1')
+    )
+    for statement in (
+        STRIP_TITLE_SLASHES, DETACH_ORPHANS, DETACH_CYCLES, DEDUPE_SIBLING_TITLES, BACKFILL_PATHS
+    ):
+        conn.execute(sa.text(statement))
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.alter_column('path', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('revision', existing_type=sa.Integer(), server_default=None)
+    op.create_index('ix_page_author_path', 'page', ['author_id', 'path'], unique=True)
+
+    # Every existing version becomes a keyframe; new versions are stored as
+    # deltas against them from here on.
+    op.add_column('page_version', sa.Column('data', sa.LargeBinary(), nullable=True))
+    op.add_column('page_version', sa.Column('base_id', sa.Integer(), nullable=True))
+    rows = conn.execute(sa.text("SELECT id, content FROM page_version")).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(
+            sa.text("UPDATE page_version SET data = :data WHERE id = :id"),
+            [
+                {"id": id, "data": delta.compress(content)}
+                for id, content in rows[start:start + BATCH_SIZE]
+            ],
+        )
+    with op.batch_alter_table('page_version') as batch_op:
+        batch_op.alter_column('data', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.create_foreign_key(
+            'fk_page_version_base_id', 'page_version', ['base_id'], ['id']
+        )
+        batch_op.drop_column('content')
+
+    op.create_table(
+        'page_change',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('page_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(), nullable=False),
+        sa.Column('fields', sa.JSON(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_page_change_user_seq', 'page_change', ['user_id', 'seq'])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+
+    op.drop_index('ix_page_change_user_seq', table_name='page_change')
+    op.drop_table('page_change')
+
+    op.add_column('page_version', sa.Column('content', sa.String(), nullable=True))
+    keyframes: dict[int, str] = {}
+    rows = conn.execute(
+        sa.text("SELECT id, base_id, data FROM page_version ORDER BY base_id IS NOT NULL")
+    ).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        updates = []
+        for id, base_id, data in rows[start:start + BATCH_SIZE]:
+            if base_id is None:
+                content = keyframes[id] = delta.decompress(data)
+            else:
+                content = delta.apply(keyframes[base_id], data)
+            updates.append({"id": id, "content": content})
+        conn.execute(
+            sa.text("UPDATE page_version SET content = :content WHERE id = :id"), updates
+        )
+    with op.batch_alter_table('page_version') as batch_op:
+        batch_op.alter_column('content', existing_type=sa.String(), nullable=False)
+        batch_op.drop_constraint('fk_page_version_base_id', type_='foreignkey')
+        batch_op.drop_column('base_id')
+        batch_op.drop_column('data')
+
+    op.drop_index('ix_page_author_path', table_name='page')
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.drop_column('revision')
+        batch_op.drop_column('path')
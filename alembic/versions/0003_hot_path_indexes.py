@@ -0,0 +1,38 @@
+"""Indexes for the hot query predicates
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Both are already checked before insert by register; the indexes make
+    # the check (and login) a seek and close the race between the two.
+    op.create_index('ix_user_username', 'user', ['username'], unique=True)
+    op.create_index('ix_user_email', 'user', ['email'], unique=True)
+
+    op.create_index('ix_page_parent_id', 'page', ['parent_id'])
+    op.create_index('ix_page_author_id', 'page', ['author_id'])
+
+    op.create_index('ix_page_version_page_created', 'page_version', ['page_id', 'created'])
+    op.create_index('ix_page_version_base_id', 'page_version', ['base_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_page_version_base_id', table_name='page_version')
+    op.drop_index('ix_page_version_page_created', table_name='page_version')
+    op.drop_index('ix_page_author_id', table_name='page')
+    op.drop_index('ix_page_parent_id', table_name='page')
+    op.drop_index('ix_user_email', table_name='user')
+    op.drop_index('ix_user_username', table_name='user')
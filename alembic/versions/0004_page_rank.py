@@ -0,0 +1,55 @@
+"""Explicit sibling order by rank key
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ludo.pages import ranks
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    # Siblings keep the order they had, which was by id.
+    op.add_column('page', sa.Column('rank', sa.String(), nullable=True))
+    rows = conn.execute(
+        sa.text("SELECT id, author_id, parent_id FROM page ORDER BY author_id, parent_id, id")
+    ).all()
+    params = []
+    siblings, rank = None, None
+    for id, author_id, parent_id in rows:
+        if (author_id, parent_id) != siblings:
+            siblings, rank = (author_id, parent_id), None
+        rank = ranks.rank_between(rank, None)
+        params.append({"id": id, "rank": rank})
+    for start in range(0, len(params), BATCH_SIZE):
+        conn.execute(
+            sa.text("UPDATE page SET rank = :rank WHERE id = :id"),
+            params[start:start + BATCH_SIZE],
+        )
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.alter_column('rank', existing_type=sa.String(), nullable=False)
+
+    # Leads with parent_id, so it also serves the lookups ix_page_parent_id did.
+    op.create_index('ix_page_parent_rank', 'page', ['parent_id', 'rank'])
+    op.drop_index('ix_page_parent_id', table_name='page')
+
+
+def downgrade() -> None:
+    op.create_index('ix_page_parent_id', 'page', ['parent_id'])
+    op.drop_index('ix_page_parent_rank', table_name='page')
+    with op.batch_alter_table('page') as batch_op:
+        batch_op.drop_column('rank')
@@ -0,0 +1,76 @@
+"""Index of links between pages
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ludo.pages.links import parse_links
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+RESOLVE_LINKS = """
+    UPDATE page_link SET target_id = (
+        SELECT id FROM page
+        WHERE page.author_id = page_link.author_id AND page.path = page_link.target_path
+    )
+"""
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    op.create_table(
+        'page_link',
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('target_path', sa.String(), nullable=False),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['source_id'], ['page.id'], ),
+        sa.PrimaryKeyConstraint('source_id', 'target_path')
+    )
+    op.create_index('ix_page_link_target', 'page_link', ['target_id', 'source_id'])
+    op.create_index(
+        'ix_page_link_broken',
+        'page_link',
+        ['author_id', 'target_path', 'source_id'],
+        sqlite_where=sa.text('target_id IS NULL'),
+    )
+
+    rows = []
+    pages = conn.execute(
+        sa.text(
+            "SELECT id, author_id, content FROM page "
+            "WHERE author_id IS NOT NULL AND content LIKE '%[[%'"
+        )
+    ).all()
+    for id, author_id, content in pages:
+        rows.extend(
+            {"source_id": id, "target_path": path, "author_id": author_id}
+            for path in sorted(parse_links(content))
+        )
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(
+            sa.text(
+                "INSERT INTO page_link (source_id, target_path, author_id) "
+                "VALUES (:source_id, :target_path, :author_id)"
+            ),
+            rows[start:start + BATCH_SIZE],
+        )
+    conn.execute(sa.text(RESOLVE_LINKS))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_page_link_broken', table_name='page_link')
+    op.drop_index('ix_page_link_target', table_name='page_link')
+    op.drop_table('page_link')
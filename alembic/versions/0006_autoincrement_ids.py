@@ -0,0 +1,46 @@
+"""Never reuse page or page version ids
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ludo.pages.search import CREATE_INDEX
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def _set_autoincrement(table: str, autoincrement: bool) -> None:
+    # SQLite can only add or drop AUTOINCREMENT by rebuilding the table.
+    with op.batch_alter_table(
+        table, recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}
+    ):
+        pass
+
+
+def _recreate_search_triggers() -> None:
+    # Rebuilding `page` drops the triggers that keep page_fts current; the
+    # index itself is keyed by page id, which the rebuild keeps.
+    if sa.inspect(op.get_bind()).has_table('page_fts'):
+        for statement in CREATE_INDEX:
+            op.execute(statement)
+
+
+def upgrade() -> None:
+    _set_autoincrement('page', True)
+    _set_autoincrement('page_version', True)
+    _recreate_search_triggers()
+
+
+def downgrade() -> None:
+    _set_autoincrement('page_version', False)
+    _set_autoincrement('page', False)
+    _recreate_search_triggers()
@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+from starlite.types import ASGIApp
+
+
+@asynccontextmanager
+async def serve_in_process(app: ASGIApp) -> AsyncIterator[httpx.AsyncClient]:
+    # Drive the ASGI lifespan ourselves so startup hooks run on this event
+    # loop, then talk to the app through httpx without a network hop.
+    messages: asyncio.Queue = asyncio.Queue()
+    started = asyncio.Event()
+    stopped = asyncio.Event()
+
+    async def send(message: dict) -> None:
+        if message["type"].startswith("lifespan.startup"):
+            started.set()
+        elif message["type"].startswith("lifespan.shutdown"):
+            stopped.set()
+
+    lifespan = asyncio.create_task(
+        app({"type": "lifespan", "asgi": {"version": "3.0"}}, messages.get, send)
+    )
+    await messages.put({"type": "lifespan.startup"})
+    await started.wait()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://testserver") as client:
+            yield client
+    finally:
+        await messages.put({"type": "lifespan.shutdown"})
+        await stopped.wait()
+        await lifespan
+
+
+@asynccontextmanager
+async def serve_over_http(app: ASGIApp, port: int = 0) -> AsyncIterator[httpx.AsyncClient]:
+    # Run uvicorn on this event loop, so requests go through a real socket
+    # and HTTP parsing but the app's state stays inspectable in process.
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            await serving
+        await asyncio.sleep(0.01)
+    host, port = server.servers[0].sockets[0].getsockname()[:2]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{host}:{port}") as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await serving
@@ -0,0 +1,58 @@
+"""Count the SQL statements behind common authenticated GET requests.
+
+    python -m benchmarks.auth_queries --pages 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from sqlalchemy import event  # noqa: E402
+
+from ludo.db import read_engine, sqlalchemy_config  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process  # noqa: E402
+
+CREDENTIALS = {"username": "reader", "email": "reader@example.com", "password": "hunter2"}
+
+
+async def run(pages: int) -> None:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for engine in {sqlalchemy_config.engine, read_engine}:
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+    async with serve_in_process(app) as client:
+        await client.post("/auth/register", json=CREDENTIALS)
+        parent_id = None
+        for n in range(pages):
+            params = {"parent_id": parent_id} if parent_id and n % 5 else {}
+            response = await client.post(
+                "/api/pages",
+                json={"friendly_title": f"Page {n}", "content": "body"},
+                params=params,
+            )
+            parent_id = response.json()["id"]
+
+        for url in ["/auth/user", "/api/pages", f"/api/pages/{parent_id}", "/api/pages/tree"]:
+            statements.clear()
+            response = await client.get(url)
+            response.raise_for_status()
+            print(f"GET {url:<24} {len(statements):>3} queries")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages))
+
+
+if __name__ == "__main__":
+    main()
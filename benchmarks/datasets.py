@@ -0,0 +1,168 @@
+"""Seed a ludo instance with a synthetic wiki.
+
+Each user gets `fanout` root pages, each of those `fanout` children, and so
+on down to `depth` levels, with `versions` saved versions per page. Pages
+go in through the NDJSON import endpoint, so seeding a big dataset takes
+seconds rather than one request per page.
+
+    python -m benchmarks.datasets --url http://localhost:8000 --depth 3 --fanout 5
+
+replaces makepages.sh for anything beyond a quick demo.
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import json
+import random
+from typing import Iterator
+
+import httpx
+
+WORDS = (
+    "wiki page link note draft idea plan list table query index cache tree "
+    "node path move edit save version change search title content author"
+).split()
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 4
+    depth: int = 3
+    fanout: int = 8
+    page_size: int = 2000
+    versions: int = 4
+    seed: int = 0
+
+    @property
+    def pages_per_user(self) -> int:
+        return sum(self.fanout**level for level in range(1, self.depth + 1))
+
+
+@dataclass
+class SeededUser:
+    username: str
+    password: str
+    headers: dict[str, str]
+    # Page id -> current path, and which pages may be moved where: leaves
+    # are only ever moved under inner pages, so neither set changes shape.
+    paths: dict[int, str] = field(default_factory=dict)
+    leaves: list[int] = field(default_factory=list)
+    inner: list[int] = field(default_factory=list)
+
+
+def text(rng: random.Random, size: int) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choices(WORDS, k=rng.randint(6, 14))) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines)[:size]
+
+
+def edit(rng: random.Random, content: str) -> str:
+    # A typical save touches a few lines rather than rewriting the page.
+    lines = content.splitlines(keepends=True) or [""]
+    for _ in range(rng.randint(1, 3)):
+        lines[rng.randrange(len(lines))] = " ".join(rng.choices(WORDS, k=8)) + "\n"
+    return "".join(lines)
+
+
+def page_lines(spec: DatasetSpec, rng: random.Random) -> Iterator[dict]:
+    # Breadth first, so every parent line comes before its children. Ids
+    # are local to the stream; the importer maps them to real ones.
+    next_id = 1
+    level = [None]
+    for depth in range(1, spec.depth + 1):
+        next_level = []
+        for parent_id in level:
+            for n in range(spec.fanout):
+                page_id = next_id
+                next_id += 1
+                title = f"page-{page_id}"
+                content = text(rng, spec.page_size)
+                yield {
+                    "id": page_id,
+                    "parent_id": parent_id,
+                    "title": title,
+                    "friendly_title": f"Page {page_id}",
+                    "content": content,
+                }
+                for _ in range(spec.versions):
+                    content = edit(rng, content)
+                    yield {"type": "version", "page_id": page_id, "title": title, "content": content}
+                next_level.append(page_id)
+        level = next_level
+
+
+async def seed_user(client: httpx.AsyncClient, spec: DatasetSpec, n: int) -> SeededUser:
+    username = f"bench-{n}"
+    credentials = {"username": username, "email": f"{username}@example.com", "password": "bench"}
+    response = await client.post("/auth/register", json=credentials)
+    if response.status_code == 401:
+        response = await client.post("/auth/login", json=credentials)
+    response.raise_for_status()
+    user = SeededUser(
+        username, "bench", {"Authorization": response.headers["authorization"]}
+    )
+
+    rng = random.Random(spec.seed * 1_000_003 + n)
+    body = "".join(json.dumps(line) + "\n" for line in page_lines(spec, rng))
+    response = await client.post("/api/pages/import", content=body, headers=user.headers)
+    response.raise_for_status()
+
+    # Read back the real ids, in the same order they were imported in.
+    response = await client.get("/api/pages/tree", headers=user.headers)
+    response.raise_for_status()
+    stack = [(node, "") for node in response.json()]
+    while stack:
+        node, prefix = stack.pop()
+        path = f"{prefix}/{node['title']}"
+        user.paths[node["id"]] = path
+        (user.inner if node["children"] else user.leaves).append(node["id"])
+        stack.extend((child, path) for child in node["children"])
+    return user
+
+
+async def seed(client: httpx.AsyncClient, spec: DatasetSpec) -> list[SeededUser]:
+    return [await seed_user(client, spec, n) for n in range(spec.users)]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = DatasetSpec()
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--page-size", type=int, default=defaults.page_size, help="bytes")
+    parser.add_argument("--versions", type=int, default=defaults.versions, help="per page")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def spec_from_args(args: argparse.Namespace) -> DatasetSpec:
+    return DatasetSpec(
+        users=args.users,
+        depth=args.depth,
+        fanout=args.fanout,
+        page_size=args.page_size,
+        versions=args.versions,
+        seed=args.seed,
+    )
+
+
+async def run(url: str, spec: DatasetSpec) -> None:
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        users = await seed(client, spec)
+    for user in users:
+        print(f"{user.username}: {len(user.paths)} pages")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, spec_from_args(args)))
+
+
+if __name__ == "__main__":
+    main()
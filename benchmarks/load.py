@@ -0,0 +1,365 @@
+"""Load test the API with a mix of reads and writes over a seeded wiki.
+
+Seeds a fresh database (see benchmarks.datasets), then runs `--concurrency`
+clients for `--duration` seconds. Each picks scenarios at random by
+`--mix` weight, acting as one of the seeded users. Reports latency
+percentiles, throughput and SQL statements per request for each scenario.
+
+The app runs in this process, either called directly over ASGI or served by
+uvicorn on a local port (`--transport http`). `--url` targets a server that
+is already running instead; SQL counts are not available then.
+
+    python -m benchmarks.load --duration 10 --save before.json
+    python -m benchmarks.load --duration 10 --compare before.json
+"""
+import argparse
+import asyncio
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Awaitable, Callable
+
+START_DIR = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlite.types import ASGIApp  # noqa: E402
+
+from ludo.db import read_engine, sqlalchemy_config  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process, serve_over_http  # noqa: E402
+from .datasets import (  # noqa: E402
+    DatasetSpec,
+    SeededUser,
+    add_arguments,
+    edit,
+    seed,
+    spec_from_args,
+    text,
+)
+
+SQL_COUNT_HEADER = "x-bench-sql-count"
+SQL_TIME_HEADER = "x-bench-sql-ms"
+
+DEFAULT_MIX = "tree=20,by_path=40,edit=25,move=10,login=5"
+
+
+def count_sql(app: ASGIApp) -> ASGIApp:
+    # Attribute every statement to the request whose task issued it, and
+    # report the totals in the response headers.
+    stats: ContextVar[list | None] = ContextVar("stats", default=None)
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._bench_started = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        request_stats = stats.get()
+        if request_stats is not None:
+            request_stats[0] += 1
+            request_stats[1] += time.perf_counter() - context._bench_started
+
+    for engine in {sqlalchemy_config.engine, read_engine}:
+        event.listen(engine.sync_engine, "before_cursor_execute", before)
+        event.listen(engine.sync_engine, "after_cursor_execute", after)
+
+    async def counting_app(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        request_stats = [0, 0.0]
+        stats.set(request_stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (SQL_COUNT_HEADER.encode(), str(request_stats[0]).encode()),
+                    (SQL_TIME_HEADER.encode(), f"{request_stats[1] * 1000:.3f}".encode()),
+                ]
+            await send(message)
+
+        await app(scope, receive, send_with_stats)
+
+    return counting_app
+
+
+Scenario = Callable[
+    [httpx.AsyncClient, SeededUser, random.Random, DatasetSpec], Awaitable[httpx.Response]
+]
+
+
+async def load_tree(client, user, rng, spec):
+    return await client.get("/api/pages/tree", headers=user.headers)
+
+
+async def nav_tree(client, user, rng, spec):
+    return await client.get(
+        "/api/pages/tree",
+        params={"depth": 1, "fields": "id,title,friendly_title,parent_id"},
+        headers=user.headers,
+    )
+
+
+async def by_path(client, user, rng, spec):
+    path = user.paths[rng.choice(user.leaves + user.inner)]
+    return await client.get(f"/api/pages/by-path{path}", headers=user.headers)
+
+
+async def save_edit(client, user, rng, spec):
+    page_id = rng.choice(user.leaves + user.inner)
+    return await client.put(
+        f"/api/pages/{page_id}",
+        json={"content": edit(rng, text(rng, spec.page_size))},
+        params={"save_version": True},
+        headers=user.headers,
+    )
+
+
+async def move(client, user, rng, spec):
+    page_id = rng.choice(user.leaves)
+    parent_id = rng.choice(user.inner)
+    response = await client.put(
+        f"/api/pages/move/{page_id}", params={"parent_id": parent_id}, headers=user.headers
+    )
+    if response.is_success:
+        title = user.paths[page_id].rsplit("/", 1)[1]
+        user.paths[page_id] = f"{user.paths[parent_id]}/{title}"
+    return response
+
+
+async def login(client, user, rng, spec):
+    return await client.post(
+        "/auth/login", json={"username": user.username, "password": user.password}
+    )
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "tree": load_tree,
+    "nav": nav_tree,
+    "by_path": by_path,
+    "edit": save_edit,
+    "move": move,
+    "login": login,
+}
+
+
+@dataclass
+class Sample:
+    seconds: float
+    status: int
+    queries: int | None
+    sql_ms: float | None
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    user: SeededUser,
+    mix: dict[str, int],
+    spec: DatasetSpec,
+    rng: random.Random,
+    deadline: float,
+    samples: dict[str, list[Sample]] | None,
+) -> None:
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        response = await SCENARIOS[name](client, user, rng, spec)
+        elapsed = time.perf_counter() - start
+        if samples is not None:
+            queries = response.headers.get(SQL_COUNT_HEADER)
+            sql_ms = response.headers.get(SQL_TIME_HEADER)
+            samples[name].append(
+                Sample(
+                    elapsed,
+                    response.status_code,
+                    int(queries) if queries is not None else None,
+                    float(sql_ms) if sql_ms is not None else None,
+                )
+            )
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(samples: list[Sample], duration: float) -> dict:
+    ms = [sample.seconds * 1000 for sample in samples]
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    sql_ms = [sample.sql_ms for sample in samples if sample.sql_ms is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample.status >= 400),
+        "rps": len(samples) / duration,
+        "p50_ms": percentile(ms, 0.50),
+        "p95_ms": percentile(ms, 0.95),
+        "p99_ms": percentile(ms, 0.99),
+        "queries_per_request": statistics.mean(queries) if queries else None,
+        "sql_ms_per_request": statistics.mean(sql_ms) if sql_ms else None,
+    }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    users: list[SeededUser],
+    mix: dict[str, int],
+    spec: DatasetSpec,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> dict[str, dict]:
+    async def phase(seconds: float, samples: dict[str, list[Sample]] | None) -> None:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(
+            *(
+                worker(
+                    client,
+                    users[n % len(users)],
+                    mix,
+                    spec,
+                    random.Random(spec.seed * 7919 + n),
+                    deadline,
+                    samples,
+                )
+                for n in range(concurrency)
+            )
+        )
+
+    if warmup:
+        await phase(warmup, None)
+    samples: dict[str, list[Sample]] = {name: [] for name in mix}
+    start = time.perf_counter()
+    await phase(duration, samples)
+    elapsed = time.perf_counter() - start
+
+    results = {name: summarize(s, elapsed) for name, s in samples.items() if s}
+    everything = [sample for s in samples.values() for sample in s]
+    if everything:
+        results["total"] = summarize(everything, elapsed)
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fmt(value: float | None, spec: str = ".2f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def report(results: dict[str, dict], baseline: dict[str, dict] | None = None) -> None:
+    print(
+        f"{'scenario':<10} {'reqs':>7} {'errs':>5} {'rps':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'sql ms':>7}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<10} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.1f} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+            f"{fmt(r['queries_per_request']):>8} {fmt(r['sql_ms_per_request']):>7}"
+        )
+        before = (baseline or {}).get(name)
+        if before:
+            changes = []
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request"):
+                if before.get(key) and r.get(key) is not None:
+                    changes.append(f"{key} {(r[key] - before[key]) / before[key]:+.0%}")
+            print(f"{'':<10} vs baseline: {', '.join(changes)}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    spec = spec_from_args(args)
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        serve = httpx.AsyncClient(base_url=args.url)
+    elif args.transport == "http":
+        serve = serve_over_http(count_sql(app))
+    else:
+        serve = serve_in_process(count_sql(app))
+
+    async with serve as client:
+        client.timeout = httpx.Timeout(None)
+        start = time.perf_counter()
+        users = await seed(client, spec)
+        print(
+            f"seeded {spec.users} users x {spec.pages_per_user} pages "
+            f"x {spec.versions} versions in {time.perf_counter() - start:.1f}s"
+        )
+        results = await run_load(
+            client, users, mix, spec, args.concurrency, args.duration, args.warmup
+        )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous["meta"]["dataset"] != asdict(spec) or previous["meta"]["mix"] != mix:
+            print("warning: baseline used a different dataset or mix")
+        baseline = previous["results"]
+        print(f"baseline: {previous['meta']['commit']} ({previous['meta']['created']})")
+    report(results, baseline)
+
+    if args.save:
+        meta = {
+            "commit": git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "transport": "url" if args.url else args.transport,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": mix,
+            "dataset": asdict(spec),
+        }
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--transport", choices=["asgi", "http"], default="asgi")
+    parser.add_argument("--url", help="load test a running server instead")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds, not measured")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a saved JSON file")
+    args = parser.parse_args()
+    # Paths are relative to where we were started, not the scratch directory.
+    for name in ("save", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.join(START_DIR, getattr(args, name)))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Measure page-read latency while a burst of logins is hashing passwords.
+
+Runs the app in process against a throwaway database. A reader fetches one
+page in a loop, first alone and then alongside concurrent login loops. It
+runs once with the bounded hashing pool and once with bcrypt called
+inline on the event loop, which is how login used to work.
+
+    python -m benchmarks.login_storm --logins 16 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from ludo import auth  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process  # noqa: E402
+
+CREDENTIALS = {"username": "storm", "email": "storm@example.com", "password": "hunter2"}
+
+
+class InlineHasher:
+    # The old behaviour: bcrypt runs on, and blocks, the event loop.
+    def __init__(self, context):
+        self.context = context
+
+    async def hash(self, password):
+        return self.context.hash(password)
+
+    async def verify(self, password, hashed):
+        return self.context.verify(password, hashed)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def read_loop(client, url: str, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def login_loop(client, stop: asyncio.Event, statuses: list[int]) -> None:
+    while not stop.is_set():
+        response = await client.post("/auth/login", json=CREDENTIALS)
+        statuses.append(response.status_code)
+        if response.status_code == 503:
+            await asyncio.sleep(0.05)
+
+
+async def measure(client, url: str, logins: int, seconds: float) -> tuple[list[float], list[int]]:
+    stop = asyncio.Event()
+    statuses: list[int] = []
+    reader = asyncio.create_task(read_loop(client, url, stop))
+    storm = [asyncio.create_task(login_loop(client, stop, statuses)) for _ in range(logins)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*storm)
+    return await reader, statuses
+
+
+def report(label: str, latencies: list[float], statuses: list[int]) -> None:
+    ms = [latency * 1000 for latency in latencies]
+    logins = sum(1 for status in statuses if status == 201)
+    rejected = sum(1 for status in statuses if status == 503)
+    print(
+        f"{label:<24} reads={len(ms):>6}  p50={statistics.median(ms):7.2f}ms  "
+        f"p95={percentile(ms, 0.95):7.2f}ms  max={max(ms):8.2f}ms  "
+        f"logins={logins:>4}  rejected={rejected:>4}"
+    )
+
+
+async def run(logins: int, seconds: float) -> None:
+    async with serve_in_process(app) as client:
+        await client.post("/auth/register", json=CREDENTIALS)
+        page = await client.post(
+            "/api/pages", json={"friendly_title": "Storm", "content": "x" * 2000}
+        )
+        url = f"/api/pages/{page.json()['id']}"
+
+        latencies, statuses = await measure(client, url, 0, seconds)
+        report("idle", latencies, statuses)
+
+        latencies, statuses = await measure(client, url, logins, seconds)
+        report("storm, hashing pool", latencies, statuses)
+
+        pooled = auth.password_hasher
+        auth.password_hasher = InlineHasher(auth.crypt_context)
+        try:
+            latencies, statuses = await measure(client, url, logins, seconds)
+            report("storm, inline bcrypt", latencies, statuses)
+        finally:
+            auth.password_hasher = pooled
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=16, help="concurrent login loops")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Check move cycle detection on big trees.
+
+Seeds one user with a wide tree (`fanout` pages under each of `fanout`
+roots) and a chain `chain` pages deep, then moves pages around both.
+Moves that would put a page under itself or its descendants must be
+rejected, every other move accepted, and each one must check for a cycle
+with at most one query however deep or wide the tree is.
+
+    python -m benchmarks.move_cycles --fanout 100 --chain 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from sqlalchemy import event  # noqa: E402
+
+from ludo.db import sqlalchemy_config  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process  # noqa: E402
+from .datasets import DatasetSpec, seed  # noqa: E402
+
+
+def chain_lines(depth: int) -> str:
+    # One-letter titles keep the paths of a deep chain as short as they get.
+    lines = [{"id": "chain-1", "title": "chain", "content": ""}]
+    for n in range(2, depth + 1):
+        lines.append({"id": f"chain-{n}", "parent_id": f"chain-{n - 1}", "title": "c"})
+    lines.append({"title": "loose", "content": ""})
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+async def run(fanout: int, chain: int) -> None:
+    spec = DatasetSpec(users=1, depth=2, fanout=fanout, page_size=100, versions=0)
+    async with serve_in_process(app) as client:
+        client.timeout = None
+        start = time.perf_counter()
+        (user,) = await seed(client, spec)
+        response = await client.post(
+            "/api/pages/import", content=chain_lines(chain), headers=user.headers
+        )
+        response.raise_for_status()
+        print(
+            f"seeded {spec.pages_per_user} pages {fanout} wide and a chain of {chain} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        async def page_at(path: str) -> int:
+            response = await client.get(f"/api/pages/by-path{path}", headers=user.headers)
+            response.raise_for_status()
+            return response.json()["id"]
+
+        roots = [id for id, path in user.paths.items() if path.count("/") == 1]
+        children = [
+            id for id, path in user.paths.items() if path.startswith(user.paths[roots[0]] + "/")
+        ]
+        top = await page_at("/chain")
+        bottom = await page_at("/chain" + "/c" * (chain - 1))
+        loose = await page_at("/loose")
+
+        queries = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if "ancestors" in statement:
+                queries.append(statement)
+
+        event.listen(sqlalchemy_config.engine.sync_engine, "before_cursor_execute", count)
+        failures = 0
+        for name, page_id, parent_id, accept in (
+            ("root under itself", roots[0], roots[0], False),
+            ("root under its child", roots[0], children[0], False),
+            ("child under another root", children[1], roots[1], True),
+            ("child under a sibling", children[2], children[3], True),
+            ("root under another root", roots[2], roots[3], True),
+            ("root under its new parent", roots[3], roots[2], False),
+            ("chain top under its bottom", top, bottom, False),
+            ("page under the chain bottom", loose, bottom, True),
+            ("chain bottom under a root", bottom, roots[0], True),
+        ):
+            queries.clear()
+            start = time.perf_counter()
+            response = await client.put(
+                f"/api/pages/move/{page_id}", params={"parent_id": parent_id}, headers=user.headers
+            )
+            elapsed = time.perf_counter() - start
+            expected = 200 if accept else 422
+            # Moves under a root, or a page under itself, need no query.
+            ok = response.status_code == expected and len(queries) <= 1
+            failures += not ok
+            print(
+                f"{'ok  ' if ok else 'FAIL'} {name:<28} {response.status_code} "
+                f"in {elapsed * 1000:6.1f}ms with {len(queries)} cycle check queries"
+            )
+        if failures:
+            raise SystemExit(f"{failures} moves behaved unexpectedly")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fanout", type=int, default=100)
+    parser.add_argument("--chain", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.fanout, args.chain))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Check that no hot query falls back to a full table scan.
+
+Drives the API in process against a freshly migrated database, records
+every SELECT, UPDATE and DELETE it issues, and runs EXPLAIN QUERY PLAN on
+each one. Exits non-zero if any plan scans one of our tables.
+
+    python -m benchmarks.query_plans [--verbose]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from sqlalchemy import event  # noqa: E402
+
+from ludo.db import Base, read_engine, sqlalchemy_config  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process  # noqa: E402
+
+CREDENTIALS = {"username": "planner", "email": "planner@example.com", "password": "hunter2"}
+
+SCAN = re.compile(r"\bSCAN (\w+)")
+
+
+async def exercise(client) -> None:
+    # One call per query shape the API has; the data only needs to exist.
+    async def raise_for_status(response):
+        response.raise_for_status()
+
+    client.event_hooks["response"].append(raise_for_status)
+    await client.post("/auth/register", json=CREDENTIALS)
+    await client.post("/auth/login", json=CREDENTIALS)
+    await client.get("/auth/user")
+
+    async def create(title, parent=None, content=""):
+        params = {"parent_id": parent["id"]} if parent else {}
+        response = await client.post(
+            "/api/pages", json={"friendly_title": title, "content": content}, params=params
+        )
+        return response.json()
+
+    root = await create("Root", content="[[/other]] [[/missing]] [[/nowhere]]")
+    child = await create("Child", root)
+    other = await create("Other", content="[[/root/child]]")
+    leaf = await create("Leaf", child)
+
+    for n in range(3):
+        await client.put(
+            f"/api/pages/{leaf['id']}",
+            json={"content": f"edit {n}"},
+            params={"save_version": True},
+        )
+    await client.put(f"/api/pages/{leaf['id']}", json={"title": "renamed-leaf"})
+    response = await client.get(f"/api/pages/{leaf['id']}")
+    revision = int(response.headers["etag"].strip('"').split("-")[1])
+    await client.patch(
+        f"/api/pages/{leaf['id']}",
+        json={"base_revision": revision, "splices": [{"start": 0, "end": 0, "text": "> "}]},
+        params={"save_version": True},
+    )
+
+    response = await client.get("/api/pages", params={"limit": 1})
+    await client.get(
+        "/api/pages", params={"limit": 1, "cursor": response.headers["x-next-cursor"]}
+    )
+    await client.get("/api/pages/tree")
+    await client.get("/api/pages/tree", params={"id": root["id"]})
+    await client.get("/api/pages/tree", params={"depth": 1, "fields": "id,title"})
+    await client.get(f"/api/pages/{leaf['id']}")
+    await client.get(f"/api/pages/{leaf['id']}", headers={"If-None-Match": '"0-0"'})
+    await client.get(f"/api/pages/{leaf['id']}", params={"versions_back": 2})
+    await client.get(f"/api/pages/{leaf['id']}/path")
+    await client.get("/api/pages/by-path/root/child/renamed-leaf")
+    response = await client.get(f"/api/pages/{leaf['id']}/versions", params={"limit": 1})
+    await client.get(
+        f"/api/pages/{leaf['id']}/versions",
+        params={"limit": 1, "cursor": response.headers["x-next-cursor"]},
+    )
+    version_id = response.json()[0]["id"]
+    await client.get(f"/api/pages/{leaf['id']}/diff", params={"from": version_id})
+    await client.get(
+        f"/api/pages/{leaf['id']}/diff",
+        params={"from": version_id - 1, "to": version_id, "mode": "word"},
+    )
+    await client.get("/api/pages/search", params={"q": "edit"})
+    await client.get("/api/pages/changes", params={"since": 1})
+    await client.get(f"/api/pages/{other['id']}/backlinks")
+    response = await client.get("/api/pages/links/broken", params={"limit": 1})
+    await client.get(
+        "/api/pages/links/broken",
+        params={"limit": 1, "cursor": response.headers["x-next-cursor"]},
+    )
+
+    await client.put(f"/api/pages/move/{child['id']}", params={"parent_id": other["id"]})
+    await client.put(f"/api/pages/move/{other['id']}", params={"parent_id": root["id"]})
+    await client.put(
+        f"/api/pages/move/{child['id']}",
+        params={"parent_id": root["id"], "before_id": other["id"]},
+    )
+    await client.put(
+        f"/api/pages/move/{child['id']}",
+        params={"parent_id": root["id"], "after_id": other["id"]},
+    )
+    await client.delete(f"/api/pages/{leaf['id']}/versions/drop", params={"keep": 1})
+
+    lines = [
+        {"id": 1, "title": "imported"},
+        {"id": 2, "parent_id": 1, "title": "imported-child"},
+        {"parent_path": "/root", "title": "under-root"},
+        {"type": "version", "page_id": 2, "content": "old"},
+    ]
+    await client.post(
+        "/api/pages/import", content="\n".join(json.dumps(line) for line in lines)
+    )
+    await client.get("/api/pages/export", params={"versions": True})
+
+    await client.delete(f"/api/pages/{leaf['id']}")
+    await client.delete(f"/api/pages/{root['id']}", params={"force": True})
+
+
+def plan_for(db: sqlite3.Connection, statement: str, parameters) -> list[str]:
+    rows = db.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+async def run(verbose: bool) -> int:
+    statements: dict[str, tuple] = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("SELECT", "WITH", "UPDATE", "DELETE"):
+            statements.setdefault(statement, parameters[0] if executemany else parameters)
+
+    async with serve_in_process(app) as client:
+        for engine in {sqlalchemy_config.engine, read_engine}:
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+        await exercise(client)
+
+    tables = set(Base.metadata.tables)
+    failures = 0
+    db = sqlite3.connect("db.sqlite")
+    for statement, parameters in statements.items():
+        plan = plan_for(db, statement, parameters)
+        scans = [line for line in plan if (m := SCAN.search(line)) and m.group(1) in tables]
+        if scans or verbose:
+            print(" ".join(statement.split()))
+            for line in plan:
+                print(f"    {line}")
+            print()
+        failures += bool(scans)
+
+    print(f"{len(statements)} statements, {failures} with a full table scan")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.verbose)))
+
+
+if __name__ == "__main__":
+    main()
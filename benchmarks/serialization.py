@@ -0,0 +1,210 @@
+"""Compare DTO-based and row-based JSON encoding of read payloads.
+
+Fills a scratch database, then times the page list, the full tree and a
+version list both ways: loading ORM objects and going through the pydantic
+models as the endpoints used to, and encoding plain dicts built from row
+tuples as they do now. Both must produce the same JSON.
+
+    python -m benchmarks.serialization --pages 5000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import Awaitable, Callable
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from sqlalchemy import insert, literal, select  # noqa: E402
+from pydantic import BaseModel, Field  # noqa: E402
+from sqlalchemy.engine import Row  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from starlite.utils.serialization import encode_json  # noqa: E402
+
+import ludo.main  # noqa: E402, F401  (configures every model)
+from ludo.auth import User  # noqa: E402
+from ludo.db import Base  # noqa: E402
+from ludo.pages import delta, ranks  # noqa: E402
+from ludo.pages.models import (  # noqa: E402
+    PAGE_OUT_COLUMNS,
+    Page,
+    PageOutDTO,
+    PageVersion,
+    PageVersionDTO,
+)
+
+from .datasets import text  # noqa: E402
+
+
+class OldPageWithChildren(BaseModel):
+    # PageWithChildren before it grew has_children.
+    id: int | None = None
+    title: str | None = None
+    content: str
+    friendly_title: str | None = None
+    parent_id: int | None = None
+    children: list["OldPageWithChildren"] = Field(default_factory=list)
+
+    class Config:
+        orm_mode = True
+
+
+async def fill(session: AsyncSession, pages: int, versions: int, size: int) -> int:
+    rng = random.Random(0)
+    await session.execute(
+        insert(User), [{"id": 1, "username": "bench", "email": "b@x", "password": "-"}]
+    )
+    rows = []
+    last_ranks: dict[int | None, str] = {}
+    for page_id in range(1, pages + 1):
+        parent_id = rng.randrange(1, page_id) if page_id > 8 else None
+        rank = last_ranks[parent_id] = ranks.rank_between(last_ranks.get(parent_id), None)
+        rows.append(
+            {
+                "id": page_id,
+                "title": f"page-{page_id}",
+                "friendly_title": f"Page {page_id}",
+                "content": text(rng, size),
+                "parent_id": parent_id,
+                "path": f"/page-{page_id}",
+                "rank": rank,
+                "revision": 1,
+                "author_id": 1,
+            }
+        )
+    await session.execute(insert(Page), rows)
+    await session.execute(
+        insert(PageVersion),
+        [
+            {
+                "title": "page-1",
+                "friendly_title": "Page 1",
+                "data": delta.compress(text(rng, size)),
+                "page_id": 1,
+            }
+            for _ in range(versions)
+        ],
+    )
+    await session.commit()
+    return pages
+
+
+async def pages_via_dto(session: AsyncSession) -> bytes:
+    pages = (await session.scalars(select(Page).order_by(Page.id))).all()
+    return encode_json([PageOutDTO.from_model_instance(page) for page in pages])
+
+
+async def pages_via_rows(session: AsyncSession) -> bytes:
+    rows = (await session.execute(select(*PAGE_OUT_COLUMNS).order_by(Page.id))).all()
+    return encode_json([Row._asdict(row) for row in rows])
+
+
+async def tree_via_models(session: AsyncSession) -> bytes:
+    # Page.load_tree as it was: whole rows, one from_orm per node. Same
+    # query as tree_nodes, so only the encoding differs.
+    tree = (
+        select(Page.id, literal(0).label("depth"))
+        .where((Page.parent_id == None) & (Page.author_id == 1))
+        .cte("tree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(Page.id, tree.c.depth + 1).join(tree, Page.parent_id == tree.c.id)
+    )
+    result = await session.execute(
+        select(Page, tree.c.depth)
+        .join(tree, Page.id == tree.c.id)
+        .order_by(tree.c.depth, Page.rank, Page.id)
+    )
+    nodes: dict[int, OldPageWithChildren] = {}
+    roots = []
+    for page, depth in result:
+        node = nodes[page.id] = OldPageWithChildren.from_orm(page)
+        if depth == 0:
+            roots.append(node)
+        else:
+            nodes[page.parent_id].children.append(node)
+    session.expunge_all()
+    return encode_json(roots)
+
+
+async def tree_via_rows(session: AsyncSession) -> bytes:
+    return encode_json(await Page.tree_nodes(session, author_id=1))
+
+
+async def versions_via_dto(session: AsyncSession) -> bytes:
+    versions = (await session.scalars(select(PageVersion).order_by(PageVersion.id))).all()
+    contents = await PageVersion.load_contents(session, versions)
+    session.expunge_all()
+    return encode_json(
+        [
+            PageVersionDTO(
+                id=version.id,
+                title=version.title,
+                friendly_title=version.friendly_title,
+                content=contents[version.id],
+                page_id=version.page_id,
+                created=version.created,
+            )
+            for version in versions
+        ]
+    )
+
+
+async def versions_via_rows(session: AsyncSession) -> bytes:
+    versions = (await session.scalars(select(PageVersion).order_by(PageVersion.id))).all()
+    contents = await PageVersion.load_contents(session, versions)
+    session.expunge_all()
+    return encode_json([version.to_dict(contents[version.id]) for version in versions])
+
+
+Encoder = Callable[[AsyncSession], Awaitable[bytes]]
+
+CASES: dict[str, tuple[Encoder, Encoder]] = {
+    "page list": (pages_via_dto, pages_via_rows),
+    "tree": (tree_via_models, tree_via_rows),
+    "versions": (versions_via_dto, versions_via_rows),
+}
+
+
+async def best_of(session: AsyncSession, encode: Encoder, repeat: int) -> tuple[float, bytes]:
+    times = []
+    for _ in range(repeat):
+        session.expunge_all()
+        start = time.perf_counter()
+        body = await encode(session)
+        times.append(time.perf_counter() - start)
+    return min(times), body
+
+
+async def run(args: argparse.Namespace) -> None:
+    engine = create_async_engine("sqlite+aiosqlite:///serialization.sqlite")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        await fill(session, args.pages, args.versions, args.page_size)
+
+        print(f"{'payload':<10} {'KiB':>8} {'models ms':>10} {'rows ms':>8} {'speedup':>8}")
+        for name, (old, new) in CASES.items():
+            old_time, old_body = await best_of(session, old, args.repeat)
+            new_time, new_body = await best_of(session, new, args.repeat)
+            assert old_body == new_body, f"{name}: payloads differ"
+            print(
+                f"{name:<10} {len(new_body) / 1024:>8.0f} {old_time * 1000:>10.1f} "
+                f"{new_time * 1000:>8.1f} {old_time / new_time:>7.1f}x"
+            )
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--versions", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=500, help="bytes")
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Time deleting a large subtree, versions and all.
+
+Seeds one user with `fanout` trees `depth` levels deep, moves them all
+under a single page, and deletes that page with force=true.
+
+    python -m benchmarks.subtree_delete --depth 4 --fanout 10 --versions 9
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.chdir(tempfile.mkdtemp(prefix="ludo-bench-"))
+
+from sqlalchemy import event  # noqa: E402
+
+from ludo.db import sqlalchemy_config  # noqa: E402
+from ludo.main import app  # noqa: E402
+
+from .asgi import serve_in_process  # noqa: E402
+from .datasets import DatasetSpec, seed  # noqa: E402
+
+
+async def run(spec: DatasetSpec) -> None:
+    async with serve_in_process(app) as client:
+        client.timeout = None
+        start = time.perf_counter()
+        (user,) = await seed(client, spec)
+        print(
+            f"seeded {spec.pages_per_user} pages x {spec.versions} versions "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        response = await client.post(
+            "/api/pages", json={"friendly_title": "Doomed", "content": ""}, headers=user.headers
+        )
+        doomed = response.json()["id"]
+        roots = [page_id for page_id, path in user.paths.items() if path.count("/") == 1]
+        for page_id in roots:
+            response = await client.put(
+                f"/api/pages/move/{page_id}", params={"parent_id": doomed}, headers=user.headers
+            )
+            response.raise_for_status()
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(sqlalchemy_config.engine.sync_engine, "before_cursor_execute", count)
+        start = time.perf_counter()
+        response = await client.delete(
+            f"/api/pages/{doomed}", params={"force": True}, headers=user.headers
+        )
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        print(
+            f"deleted {spec.pages_per_user + 1} pages and "
+            f"{spec.pages_per_user * spec.versions} versions in {elapsed:.2f}s "
+            f"with {len(statements)} statements"
+        )
+
+        response = await client.get("/api/pages", params={"limit": 1}, headers=user.headers)
+        assert response.json() == [], response.json()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--versions", type=int, default=9)
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+    spec = DatasetSpec(
+        users=1,
+        depth=args.depth,
+        fanout=args.fanout,
+        versions=args.versions,
+        page_size=args.page_size,
+    )
+    asyncio.run(run(spec))
+
+
+if __name__ == "__main__":
+    main()
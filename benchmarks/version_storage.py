@@ -0,0 +1,87 @@
+"""Compare page_version storage with and without delta compression.
+
+Replays a synthetic edit history (small line edits and appends to
+medium-sized pages) through PageVersion.from_page against an in-memory
+database and reports the bytes stored versus full uncompressed copies.
+
+    python -m benchmarks.version_storage --pages 20 --edits 200
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from ludo.db import Base
+from ludo.pages import ranks
+from ludo.pages.models import Page, PageVersion
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod".split()
+
+
+def random_line(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(4, 16))) + "\n"
+
+
+def edit(rng: random.Random, lines: list[str]) -> None:
+    roll = rng.random()
+    if roll < 0.6:
+        lines[rng.randrange(len(lines))] = random_line(rng)
+    elif roll < 0.9:
+        lines.insert(rng.randrange(len(lines) + 1), random_line(rng))
+    elif len(lines) > 1:
+        del lines[rng.randrange(len(lines))]
+
+
+async def run(pages: int, edits: int, lines: int, seed: int) -> None:
+    rng = random.Random(seed)
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    raw_bytes = 0
+    rank = None
+    async with async_sessionmaker(engine)() as session:
+        for n in range(pages):
+            rank = ranks.rank_between(rank, None)
+            body = [random_line(rng) for _ in range(lines)]
+            page = Page(
+                title=f"page-{n}",
+                friendly_title=f"Page {n}",
+                content="".join(body),
+                path=f"/page-{n}",
+                rank=rank,
+            )
+            session.add(page)
+            await session.flush()
+            for _ in range(edits):
+                session.add(await PageVersion.from_page(page, session))
+                raw_bytes += len(page.content.encode())
+                edit(rng, body)
+                page.content = "".join(body)
+                await session.flush()
+        await session.commit()
+
+        stored_bytes = await session.scalar(select(func.sum(func.length(PageVersion.data))))
+        versions = await session.scalar(select(func.count()).select_from(PageVersion))
+    await engine.dispose()
+
+    print(f"versions:      {versions}")
+    print(f"full copies:   {raw_bytes:>12,} bytes")
+    print(f"stored:        {stored_bytes:>12,} bytes")
+    print(f"saved:         {1 - stored_bytes / raw_bytes:>12.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.edits, args.lines, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 from __future__ import annotations
-from typing import Any
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
 
 from passlib.context import CryptContext
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from starlite import (
@@ -12,22 +15,26 @@ from starlite import (
     Response,
     Request,
     Router,
+    ServiceUnavailableException,
     get,
     post,
 )
 from starlite.contrib.jwt import JWTCookieAuth, Token
 
 from .db import Base, dto_factory
+from .settings import settings
 
 
 class User(Base):
     __tablename__ = "user"
     id: Mapped[int] = mapped_column(primary_key=True)
-    username: Mapped[str]
-    email: Mapped[str | None] = mapped_column(default=None)
+    username: Mapped[str] = mapped_column(unique=True, index=True)
+    email: Mapped[str | None] = mapped_column(default=None, unique=True, index=True)
     password: Mapped[str]
 
-    pages: Mapped[list[Page]] = relationship(back_populates="author", lazy="selectin")
+    # Never loaded implicitly (it would pull every page on each login); query
+    # Page by author_id instead.
+    pages: Mapped[list[Page]] = relationship(back_populates="author", lazy="noload")
 
 
 from ludo.pages.models import Page
@@ -40,6 +47,49 @@ UserOutDTO = dto_factory("UserOutDTO", User, exclude=["password", "pages"])
 # Create Crypt Context
 crypt_context = CryptContext(schemes=["bcrypt"])
 
+T = TypeVar("T")
+
+
+class PasswordHasher:
+    """Runs bcrypt on a thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL, so hashes run in parallel. The number of
+    running plus waiting hashes is capped, and calls beyond the cap fail
+    fast with a 503 instead of queueing without limit.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_pending: int) -> None:
+        self.context = context
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.pending >= self.max_pending:
+            raise ServiceUnavailableException(
+                detail="Too many logins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+
+password_hasher = PasswordHasher(
+    crypt_context,
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
+
 
 async def retrieve_user(token: Token, connection: ASGIConnection) -> UserOutDTO:
     user_dict = await connection.cache.get(token.sub)
@@ -50,7 +100,7 @@ async def retrieve_user(token: Token, connection: ASGIConnection) -> UserOutDTO:
 jwt_cookie_auth = JWTCookieAuth[User](
     retrieve_user_handler=retrieve_user,
     token_secret="abcd123",
-    exclude=["/login", "/register"],
+    exclude=["/login", "/register", "/metrics"],
 )
 
 
@@ -68,11 +118,15 @@ async def register_user_handler(
     if result.one_or_none() is not None:
         raise NotAuthorizedException(detail="Username or email is already registered")
 
-    hashed_password = crypt_context.hash(data.password)
+    hashed_password = await password_hasher.hash(data.password)
 
     db_user = User(**data.dict(exclude={"password"}), password=hashed_password)
     session.add(db_user)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Registered by a concurrent request since the check above.
+        raise NotAuthorizedException(detail="Username or email is already registered")
     await session.refresh(db_user)
 
     user_out = UserOutDTO.from_model_instance(db_user)
@@ -101,7 +155,7 @@ async def _verify_user(data: UserInDTO, session: AsyncSession) -> User:
     if user is None:
         raise NotAuthorizedException("Username or email not registered")
 
-    if not crypt_context.verify(data.password, user.password):
+    if not await password_hasher.verify(data.password, user.password):
         raise NotAuthorizedException("Username and password do not match")
     return user
 
@@ -111,31 +165,30 @@ async def _verify_user(data: UserInDTO, session: AsyncSession) -> User:
 #     request: Request[Any, Any], session: AsyncSession, data: UserResetModel
 # ) -> Response[UserOutDTO]:
 async def current_active_user(
-    request: Request[UserOutDTO, JWTCookieAuth], session: AsyncSession
-) -> User:
-    user = await session.scalar(
-        select(User).where(
-            (User.username == request.user.username)
-            | (User.email == request.user.email)
-        )
-    )
-    if user is None:
+    request: Request[UserOutDTO, JWTCookieAuth]
+) -> UserOutDTO:
+    # The identity retrieve_user rebuilt from the auth cache is all handlers
+    # need, so this doesn't touch the database. Handlers that need the full
+    # row can load it with session.get(User, user.id).
+    if request.user is None:
         raise NotAuthorizedException(detail="User not logged in")
-    return user
+    return request.user
 
 
 @get("/user")
-async def get_logged_in_user(user: User) -> UserOutDTO:
-    return UserOutDTO.from_model_instance(user)
+async def get_logged_in_user(user: UserOutDTO) -> UserOutDTO:
+    return user
 
 
 @post("/logout")
-async def logout_handler(request: Request[Any, Any], user: User) -> Response[None]:
+async def logout_handler(
+    request: Request[Any, Any], user: UserOutDTO
+) -> Response[None]:
     await request.cache.delete(user.username)
     logout_cookie = Cookie(
         key=jwt_cookie_auth.key, path=jwt_cookie_auth.path, value="", expires=0
     )
-    return Response(cookies=[logout_cookie])
+    return Response(content=None, cookies=[logout_cookie])
 
 
 auth_router = Router(
@@ -1,15 +1,36 @@
-from sqlalchemy.orm import DeclarativeBase
-from starlite import DTOFactory
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Connection, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, InstrumentedAttribute
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from pydantic import BaseModel
+from starlite import DTOFactory, Provide
 from starlite.plugins.sql_alchemy import (
     SQLAlchemyConfig,
     SQLAlchemyEngineConfig,
     SQLAlchemyPlugin,
 )
 
+from .metrics import instrument_engine
+from .settings import settings
+
+MIGRATIONS_DIR = Path(__file__).parent.parent / "alembic"
+
 sqlalchemy_config = SQLAlchemyConfig(
-    connection_string="sqlite+aiosqlite:///db.sqlite",
+    connection_string=settings.database_url,
     dependency_key="session",
-    engine_config=SQLAlchemyEngineConfig(),
+    # aiosqlite defaults to NullPool, which opens a connection (and a thread)
+    # for every session.
+    engine_config=SQLAlchemyEngineConfig(
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+    ),
 )
 
 sqlalchemy_plugin = SQLAlchemyPlugin(config=sqlalchemy_config)
@@ -17,10 +38,90 @@ sqlalchemy_plugin = SQLAlchemyPlugin(config=sqlalchemy_config)
 dto_factory = DTOFactory(plugins=[sqlalchemy_plugin])
 
 
+def dto_columns(dto: type[BaseModel], model: type) -> list[InstrumentedAttribute]:
+    # The model columns behind a DTO's fields, in field order: rows selected
+    # with them encode to the same JSON as the DTO, without building one.
+    return [getattr(model, name) for name in dto.__fields__ if hasattr(model, name)]
+
+
+def _pragmas(read_only: bool) -> dict[str, Any]:
+    pragmas = {
+        "cache_size": settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+        "busy_timeout": settings.sqlite_busy_timeout,
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    else:
+        pragmas["journal_mode"] = settings.sqlite_journal_mode
+        pragmas["synchronous"] = settings.sqlite_synchronous
+    return pragmas
+
+
+def configure_connections(engine: Engine, read_only: bool = False) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = _pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+configure_connections(sqlalchemy_config.engine.sync_engine)
+instrument_engine(sqlalchemy_config.engine.sync_engine)
+
+if settings.database_read_engine:
+    read_engine = create_async_engine(
+        settings.database_url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.database_read_pool_size,
+        max_overflow=settings.database_max_overflow,
+    )
+    configure_connections(read_engine.sync_engine, read_only=True)
+    instrument_engine(read_engine.sync_engine)
+    read_session_maker = async_sessionmaker(read_engine, expire_on_commit=False)
+else:
+    read_engine = sqlalchemy_config.engine
+    read_session_maker = sqlalchemy_config.session_maker
+
+
+async def provide_read_session() -> AsyncIterator[AsyncSession]:
+    async with read_session_maker() as session:
+        yield session
+
+
+# Handlers that only read take `session` from the read engine instead:
+# @get(..., dependencies=read_only_session)
+read_only_session = {"session": Provide(provide_read_session)}
+
+
 class Base(DeclarativeBase):
     pass
 
 
+def run_migrations(connection: Connection) -> None:
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.attributes["connection"] = connection
+
+    tables = inspect(connection).get_table_names()
+    if "page" in tables and "alembic_version" not in tables:
+        # Created with create_all before there were migrations: either the
+        # original schema, or one that already has materialized paths.
+        columns = {column["name"] for column in inspect(connection).get_columns("page")}
+        command.stamp(config, "0002" if "path" in columns else "0001")
+    command.upgrade(config, "head")
+
+
 async def db_on_startup() -> None:
     async with sqlalchemy_config.engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+
+
+async def db_on_shutdown() -> None:
+    if read_engine is not sqlalchemy_config.engine:
+        await read_engine.dispose()
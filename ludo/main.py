@@ -1,24 +1,31 @@
 from starlite import Starlite, CacheConfig, CORSConfig, LoggingConfig, Provide
 
 
-from .utils import PicklingCacheBackend
-from .db import db_on_startup, sqlalchemy_plugin
+from .utils import SQLiteCacheBackend
+from .metrics import metrics_handler, metrics_on_app_init
+from .db import db_on_shutdown, db_on_startup, sqlalchemy_plugin
 from .auth import auth_router, jwt_cookie_auth, current_active_user
-from .pages.routes import PagesController
+from .pages.routes import ETAG_HEADER, NEXT_CURSOR_HEADER, PagesController
+from .pages.retention import retention_on_shutdown, retention_on_startup
+from .pages.search import search_on_startup
 
 
 app = Starlite(
     debug=True,
-    route_handlers=[auth_router, PagesController],
-    on_startup=[db_on_startup],
-    on_app_init=[jwt_cookie_auth.on_app_init],
+    route_handlers=[auth_router, PagesController, metrics_handler],
+    on_startup=[db_on_startup, search_on_startup, retention_on_startup],
+    on_shutdown=[retention_on_shutdown, db_on_shutdown],
+    on_app_init=[jwt_cookie_auth.on_app_init, metrics_on_app_init],
     plugins=[sqlalchemy_plugin],
     dependencies={"user": Provide(current_active_user)},
     cors_config=CORSConfig(
-        allow_credentials=True, allow_origins=["http://localhost:5173"]
+        allow_credentials=True,
+        allow_origins=["http://localhost:5173"],
+        expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
     ),
     cache_config=CacheConfig(
-        backend=PicklingCacheBackend("persist.pickle"), expiration=60 * 60 * 24
+        backend=SQLiteCacheBackend("cache.sqlite", max_size=10_000),
+        expiration=60 * 60 * 24,
     ),
     logging_config=LoggingConfig(
         loggers={
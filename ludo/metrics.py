@@ -0,0 +1,196 @@
+"""Request and SQL metrics, served in Prometheus text format at /metrics.
+
+Every statement run on an instrumented engine is charged to the request
+whose task issued it; statements outside a request (startup, migrations)
+are charged to a handler label of "".
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import logging
+import time
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlite import MediaType, get
+from starlite.config import AppConfig
+from starlite.exceptions import HTTPException
+from starlite.middleware import MiddlewareProtocol
+from starlite.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import settings
+
+
+logger = logging.getLogger("ludo.sql")
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class _Current:
+    handler: str
+    statements: int = 0
+    sql_seconds: float = 0.0
+    slow_statements: int = 0
+
+
+@dataclass
+class _RouteStats:
+    statuses: dict[int, int] = field(default_factory=dict)
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(DURATION_BUCKETS) + 1))
+    seconds: float = 0.0
+    statements: int = 0
+    sql_seconds: float = 0.0
+    slow_statements: int = 0
+
+
+_current: ContextVar[_Current | None] = ContextVar("ludo_metrics", default=None)
+_routes: dict[tuple[str, str], _RouteStats] = {}
+
+# Functions returning extra exposition lines, e.g. cache counters.
+collectors: list[Callable[[], Iterable[str]]] = []
+
+
+def _stats(handler: str, method: str) -> _RouteStats:
+    stats = _routes.get((handler, method))
+    if stats is None:
+        stats = _routes[(handler, method)] = _RouteStats()
+    return stats
+
+
+def instrument_engine(engine: Engine) -> None:
+    slow_seconds = settings.metrics_slow_statement_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._ludo_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - context._ludo_started
+        # Requests are merged into their route's stats once they finish.
+        current = _current.get() or _stats("", "")
+        current.statements += 1
+        current.sql_seconds += elapsed
+        if elapsed >= slow_seconds:
+            current.slow_statements += 1
+            logger.warning(
+                "Slow SQL statement (%.1f ms) in %s: %s",
+                elapsed * 1000,
+                getattr(current, "handler", "background"),
+                " ".join(statement.split())[:500],
+            )
+
+
+class MetricsMiddleware(MiddlewareProtocol):
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        handler = scope["route_handler"].handler_name
+        current = _Current(handler)
+        _current.set(current)
+        debug = scope["app"].debug
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if debug:
+                    elapsed = time.perf_counter() - started
+                    timing = (
+                        f"app;dur={elapsed * 1000:.1f}, "
+                        f"sql;dur={current.sql_seconds * 1000:.1f};"
+                        f'desc="{current.statements} statements"'
+                    )
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (SERVER_TIMING_HEADER.lower().encode(), timing.encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException as exc:
+            status = exc.status_code
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = _stats(handler, scope["method"])
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.buckets[bisect_left(DURATION_BUCKETS, elapsed)] += 1
+            stats.seconds += elapsed
+            stats.statements += current.statements
+            stats.sql_seconds += current.sql_seconds
+            stats.slow_statements += current.slow_statements
+
+
+def metrics_on_app_init(app_config: AppConfig) -> AppConfig:
+    # Outermost, so authentication is timed and its rejections counted too.
+    app_config.middleware = [MetricsMiddleware, *app_config.middleware]
+    return app_config
+
+
+def _labels(**labels: str | int) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render() -> str:
+    routes = sorted(_routes.items())
+    lines = [
+        "# HELP ludo_http_requests_total Requests handled.",
+        "# TYPE ludo_http_requests_total counter",
+    ]
+    for (handler, method), stats in routes:
+        for status, count in sorted(stats.statuses.items()):
+            labels = _labels(handler=handler, method=method, status=status)
+            lines.append(f"ludo_http_requests_total{{{labels}}} {count}")
+
+    lines += [
+        "# HELP ludo_http_request_duration_seconds Time from routing to the last byte sent.",
+        "# TYPE ludo_http_request_duration_seconds histogram",
+    ]
+    for (handler, method), stats in routes:
+        if not stats.statuses:
+            continue
+        labels = _labels(handler=handler, method=method)
+        cumulative = 0
+        for bound, count in zip((*DURATION_BUCKETS, "+Inf"), stats.buckets):
+            cumulative += count
+            lines.append(
+                f'ludo_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines.append(f"ludo_http_request_duration_seconds_sum{{{labels}}} {stats.seconds}")
+        lines.append(f"ludo_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+    for name, attr, help_text in (
+        ("ludo_sql_statements_total", "statements", "SQL statements executed."),
+        ("ludo_sql_seconds_total", "sql_seconds", "Time spent executing SQL statements."),
+        (
+            "ludo_sql_slow_statements_total",
+            "slow_statements",
+            f"SQL statements slower than {settings.metrics_slow_statement_ms} ms.",
+        ),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (handler, method), stats in routes:
+            labels = _labels(handler=handler, method=method)
+            lines.append(f"{name}{{{labels}}} {getattr(stats, attr)}")
+
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+@get("/metrics", media_type=MediaType.TEXT, include_in_schema=False)
+async def metrics_handler() -> str:
+    return render()
@@ -0,0 +1,361 @@
+"""Streaming NDJSON import and export of a user's pages.
+
+Every line is a JSON object. Page lines look like
+
+    {"id": 1, "parent_id": null, "title": "...", "friendly_title": "...", "content": "...",
+     "rank": "a0"}
+
+where `id` and `parent_id` are the client's own references, so an export
+can be imported again as is. A page may name an existing parent by
+`parent_path` instead. Parents must come before their children. Without a
+`rank`, a page goes after its siblings seen so far. Lines with
+`"type": "version"` add a version to an earlier page line, by `page_id`.
+"""
+from datetime import datetime
+import json
+from typing import Any, AsyncIterator
+
+from pydantic import BaseModel
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlite import ValidationException
+
+from ludo.db import read_session_maker
+
+from . import delta, ranks
+from .changes import PageChange, notifier
+from .links import add_links, resolve_links
+from .models import KEYFRAME_INTERVAL, Page, PageVersion
+from .tree_cache import invalidate_tree
+
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class ImportSummary(BaseModel):
+    pages: int
+    versions: int
+
+
+class _Ref:
+    # A page or version seen in the stream. `id` is assigned when its batch
+    # is written, and is what later lines referring to it resolve to.
+    # `child_rank` is the last rank given to one of its children.
+    __slots__ = ("id", "path", "child_rank")
+
+    def __init__(
+        self, path: str | None = None, id: int | None = None, child_rank: str | None = None
+    ) -> None:
+        self.path = path
+        self.id = id
+        self.child_rank = child_rank
+
+
+class PageImporter:
+    """Reads an NDJSON stream and inserts it in batched transactions.
+
+    Ids are assigned when a batch is written rather than as lines arrive, so
+    no transaction stays open while the client is still uploading.
+    """
+
+    def __init__(self, session: AsyncSession, author_id: int, batch_size: int = 1000) -> None:
+        self.session = session
+        self.author_id = author_id
+        self.batch_size = batch_size
+        self.line = 0
+        self.imported = ImportSummary(pages=0, versions=0)
+        self._pages: dict[Any, _Ref] = {}
+        self._existing: dict[str, _Ref] = {}
+        self._paths: set[str] = set()
+        # Stands in as the parent of root pages when ranking them.
+        self._root: _Ref | None = None
+        self._pending_pages: list[tuple[dict, _Ref | None, _Ref]] = []
+        self._pending_versions: list[tuple[dict, _Ref, _Ref | None, _Ref]] = []
+        # (page, keyframe, keyframe content, dependents) for the page whose
+        # versions are currently streaming in.
+        self._keyframe: tuple[_Ref, _Ref, str, int] | None = None
+
+    async def feed(self, chunks: AsyncIterator[bytes]) -> ImportSummary:
+        buffer = b""
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                await self._add_line(line)
+        await self._add_line(buffer)
+        await self._flush()
+        return self.imported
+
+    def _error(self, message: str) -> ValidationException:
+        return ValidationException(
+            detail=f"{message} (imported {self.imported.pages} pages and "
+            f"{self.imported.versions} versions before it)"
+        )
+
+    async def _add_line(self, line: bytes) -> None:
+        self.line += 1
+        if not line.strip():
+            return
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise self._error(f"Line {self.line} is not valid JSON")
+        if not isinstance(item, dict):
+            raise self._error(f"Line {self.line} is not a JSON object")
+
+        if item.get("type", "page") == "version":
+            self._add_version(item)
+        else:
+            await self._add_page(item)
+        if len(self._pending_pages) + len(self._pending_versions) >= self.batch_size:
+            await self._flush()
+
+    async def _add_page(self, item: dict) -> None:
+        title = item.get("title")
+        friendly_title = item.get("friendly_title")
+        if not title and not friendly_title:
+            raise self._error(f"Line {self.line} must set either `title` or `friendly_title`")
+        title = title or Page.slugify(friendly_title)
+        friendly_title = friendly_title or title
+        if "/" in title:
+            raise self._error(f"Line {self.line} has a `title` containing /")
+
+        parent = None
+        if item.get("parent_id") is not None:
+            parent = self._pages.get(item["parent_id"])
+            if parent is None:
+                raise self._error(f"Line {self.line} refers to a parent_id not imported yet")
+        elif item.get("parent_path"):
+            parent = await self._existing_page(item["parent_path"])
+
+        path = Page.child_path(parent, title)
+        if path in self._paths:
+            raise self._error(f"Line {self.line} repeats the path {path}")
+        self._paths.add(path)
+
+        siblings = parent or await self._root_page()
+        rank = item.get("rank")
+        if rank is None:
+            rank = ranks.rank_between(siblings.child_rank, None)
+        elif not isinstance(rank, str) or not ranks.is_valid_rank(rank):
+            raise self._error(f"Line {self.line} has an invalid `rank`")
+        if siblings.child_rank is None or rank > siblings.child_rank:
+            siblings.child_rank = rank
+
+        page = _Ref(path)
+        if item.get("id") is not None:
+            self._pages[item["id"]] = page
+        row = {
+            "title": title,
+            "friendly_title": friendly_title,
+            "content": item.get("content") or "",
+            "path": path,
+            "rank": rank,
+            "revision": 1,
+            "author_id": self.author_id,
+        }
+        self._pending_pages.append((row, parent, page))
+
+    async def _existing_page(self, path: str) -> _Ref:
+        page = self._existing.get(path)
+        if page is None:
+            page_id = await self.session.scalar(
+                select(Page.id).where((Page.author_id == self.author_id) & (Page.path == path))
+            )
+            if page_id is None:
+                await self.session.commit()
+                raise self._error(f"Line {self.line} refers to a missing parent_path {path}")
+            child_rank = await self._last_child_rank(page_id)
+            # Don't hold a read transaction open while the upload continues.
+            await self.session.commit()
+            page = self._existing[path] = _Ref(path, page_id, child_rank)
+        return page
+
+    async def _root_page(self) -> _Ref:
+        if self._root is None:
+            child_rank = await self._last_child_rank(None)
+            await self.session.commit()
+            self._root = _Ref(child_rank=child_rank)
+        return self._root
+
+    async def _last_child_rank(self, parent_id: int | None) -> str | None:
+        return await self.session.scalar(
+            select(func.max(Page.rank)).where(Page.children_of(self.author_id, parent_id))
+        )
+
+    def _add_version(self, item: dict) -> None:
+        page = self._pages.get(item.get("page_id"))
+        if page is None:
+            raise self._error(f"Line {self.line} refers to a page_id not imported yet")
+        try:
+            created = datetime.fromisoformat(item["created"]) if item.get("created") else None
+        except (TypeError, ValueError):
+            raise self._error(f"Line {self.line} has an invalid `created` timestamp")
+
+        content = item.get("content") or ""
+        version = _Ref()
+        row = {
+            "title": item.get("title") or "",
+            "friendly_title": item.get("friendly_title") or "",
+            "created": created or datetime.utcnow(),
+        }
+        keyframe = self._keyframe
+        if keyframe is not None and keyframe[0] is page and keyframe[3] < KEYFRAME_INTERVAL - 1:
+            row["data"] = delta.encode(keyframe[2], content)
+            self._keyframe = (page, keyframe[1], keyframe[2], keyframe[3] + 1)
+            base = keyframe[1]
+        else:
+            row["data"] = delta.compress(content)
+            self._keyframe = (page, version, content, 0)
+            base = None
+        self._pending_versions.append((row, page, base, version))
+
+    async def _next_id(self, model: type[Page] | type[PageVersion]) -> int:
+        # Both tables are AUTOINCREMENT: ids of deleted rows, even the
+        # highest, are never handed out again. SQLite moves the sequence
+        # past the explicit ids we insert.
+        seq = await self.session.scalar(
+            text("SELECT seq FROM sqlite_sequence WHERE name = :name"),
+            {"name": model.__tablename__},
+        )
+        top = await self.session.scalar(select(func.max(model.id)))
+        return max(seq or 0, top or 0) + 1
+
+    async def _flush(self) -> None:
+        if not self._pending_pages and not self._pending_versions:
+            return
+
+        # Ids are picked past the highest ever handed out, so no other
+        # writer may insert a page or version between reading it and
+        # committing.
+        connection = await self.session.connection()
+        if connection.dialect.name == "sqlite":
+            await connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+        next_id = await self._next_id(Page)
+        pages = []
+        for row, parent, page in self._pending_pages:
+            page.id = next_id
+            next_id += 1
+            pages.append({**row, "id": page.id, "parent_id": parent.id if parent else None})
+
+        next_id = await self._next_id(PageVersion)
+        versions = []
+        for row, page, base, version in self._pending_versions:
+            version.id = next_id
+            next_id += 1
+            versions.append(
+                {**row, "id": version.id, "page_id": page.id, "base_id": base.id if base else None}
+            )
+
+        try:
+            if pages:
+                await self.session.execute(insert(Page), pages)
+                await self.session.execute(
+                    insert(PageChange),
+                    [
+                        {
+                            "user_id": self.author_id,
+                            "page_id": page["id"],
+                            "op": "created",
+                            "fields": {
+                                key: page[key]
+                                for key in ("title", "friendly_title", "parent_id", "revision")
+                            },
+                        }
+                        for page in pages
+                    ],
+                )
+                await add_links(self.session, self.author_id, pages)
+                # Also resolves earlier links to the pages just imported.
+                await resolve_links(self.session, self.author_id, None)
+                invalidate_tree(self.session, self.author_id, None)
+            if versions:
+                await self.session.execute(insert(PageVersion), versions)
+            await self.session.commit()
+        except IntegrityError as e:
+            await self.session.rollback()
+            if "page.path" not in str(e.orig):
+                raise
+            raise self._error(
+                f"A page in the batch ending at line {self.line} has a path that already exists"
+            )
+
+        if pages:
+            notifier.notify(self.author_id)
+        self.imported.pages += len(pages)
+        self.imported.versions += len(versions)
+        self._pending_pages.clear()
+        self._pending_versions.clear()
+
+
+async def export_ndjson(author_id: int, versions: bool = False) -> AsyncIterator[bytes]:
+    # The request's session is closed once the response starts, so the
+    # export streams through its own.
+    async with read_session_maker() as session:
+        chunk = []
+        size = 0
+
+        def add(item: dict) -> bytes | None:
+            nonlocal chunk, size
+            line = json.dumps(item, default=str) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size < EXPORT_CHUNK_SIZE:
+                return None
+            data = "".join(chunk).encode()
+            chunk, size = [], 0
+            return data
+
+        # Ordering by path lists every parent before its children.
+        pages = await session.stream(
+            select(
+                Page.id,
+                Page.parent_id,
+                Page.title,
+                Page.friendly_title,
+                Page.content,
+                Page.rank,
+            )
+            .where(Page.author_id == author_id)
+            .order_by(Page.path)
+        )
+        async for row in pages:
+            data = add({"type": "page", **row._mapping})
+            if data:
+                yield data
+
+        if versions:
+            rows = await session.stream(
+                select(PageVersion)
+                .join(Page, Page.id == PageVersion.page_id)
+                .where(Page.author_id == author_id)
+                .order_by(PageVersion.page_id, PageVersion.id)
+            )
+            page_id = None
+            keyframes: dict[int, str] = {}
+            async for version in rows.scalars():
+                if version.page_id != page_id:
+                    page_id = version.page_id
+                    keyframes.clear()
+                if version.base_id is None:
+                    content = keyframes[version.id] = delta.decompress(version.data)
+                else:
+                    content = delta.apply(keyframes[version.base_id], version.data)
+                data = add(
+                    {
+                        "type": "version",
+                        "page_id": version.page_id,
+                        "title": version.title,
+                        "friendly_title": version.friendly_title,
+                        "content": content,
+                        "created": version.created.isoformat(),
+                    }
+                )
+                session.expunge(version)
+                if data:
+                    yield data
+
+        if chunk:
+            yield "".join(chunk).encode()
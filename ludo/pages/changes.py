@@ -0,0 +1,216 @@
+"""Per-user feed of page changes.
+
+Every write in PagesController records a PageChange in the same transaction
+as the write itself. `seq` only ever grows, so a client that remembers the
+last seq it saw can ask for just what changed since, or keep a server-sent
+event stream open and patch its local copy of the tree.
+
+A change carries the page's new revision and the new values of its small
+fields (title, friendly_title, parent_id, rank). Content can be any size
+and changes on every autosave, so an "updated" change only names it in
+`changed`; clients that want the new body GET the page.
+
+Changes older than `settings.change_retention` seconds are trimmed along
+with old page versions, see ludo.pages.retention. A client asking for
+changes since a seq that has been trimmed gets a 410 and has to reload.
+"""
+from __future__ import annotations
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from pydantic import BaseModel
+from sqlalchemy import (
+    JSON,
+    DateTime,
+    ForeignKey,
+    Index,
+    Select,
+    delete,
+    event,
+    func,
+    insert,
+    literal,
+    select,
+)
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, Session, mapped_column
+from starlite.utils.serialization import encode_json
+
+from ludo.db import Base, dto_columns, dto_factory, read_session_maker
+
+
+KEEPALIVE_SECONDS = 15
+
+
+class PageChange(Base):
+    __tablename__ = "page_change"
+    seq: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    page_id: Mapped[int]
+    # One of "created", "updated", "moved" or "deleted".
+    op: Mapped[str]
+    fields: Mapped[dict[str, Any]] = mapped_column(JSON, default=dict)
+    created: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+    # AUTOINCREMENT so a seq is never handed out twice.
+    __table_args__ = (
+        Index("ix_page_change_user_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+PageChangeDTO = dto_factory("PageChangeDTO", PageChange, exclude=["user_id"])
+PAGE_CHANGE_COLUMNS = dto_columns(PageChangeDTO, PageChange)
+
+
+class ChangeSet(BaseModel):
+    # Pass `seq` back as `since` to get the changes after these.
+    seq: int
+    changes: list[PageChangeDTO]
+
+
+def record_change(
+    session: AsyncSession, user_id: int, page_id: int, op: str, **fields: Any
+) -> None:
+    session.add(PageChange(user_id=user_id, page_id=page_id, op=op, fields=fields))
+
+
+async def record_changes(
+    session: AsyncSession, user_id: int, page_ids: Select, op: str
+) -> None:
+    # One change per page id selected by `page_ids`, written in a single
+    # INSERT ... SELECT without loading the pages.
+    ids = page_ids.subquery()
+    await session.execute(
+        insert(PageChange).from_select(
+            ["user_id", "page_id", "op", "fields", "created"],
+            select(
+                literal(user_id),
+                ids.c.id,
+                literal(op),
+                literal({}, JSON),
+                literal(datetime.utcnow(), DateTime),
+            ),
+        )
+    )
+    session.info.setdefault("changed_users", set()).add(user_id)
+
+
+class ChangeNotifier:
+    # Wakes up the event streams of a user once their changes are committed.
+
+    def __init__(self) -> None:
+        self._waiters: dict[int, set[asyncio.Event]] = defaultdict(set)
+
+    def notify(self, user_id: int) -> None:
+        for waiter in self._waiters.get(user_id, ()):
+            waiter.set()
+
+    @contextmanager
+    def subscribe(self, user_id: int) -> Iterator[asyncio.Event]:
+        waiter = asyncio.Event()
+        self._waiters[user_id].add(waiter)
+        try:
+            yield waiter
+        finally:
+            self._waiters[user_id].discard(waiter)
+            if not self._waiters[user_id]:
+                del self._waiters[user_id]
+
+
+notifier = ChangeNotifier()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context: Any) -> None:
+    users = {obj.user_id for obj in session.new if isinstance(obj, PageChange)}
+    if users:
+        session.info.setdefault("changed_users", set()).update(users)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_changed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_users", ()):
+        notifier.notify(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_users", None)
+
+
+async def head_seq(session: AsyncSession, user_id: int) -> int:
+    seq = await session.scalar(
+        select(func.max(PageChange.seq)).where(PageChange.user_id == user_id)
+    )
+    return seq or 0
+
+
+async def oldest_seq(session: AsyncSession) -> int:
+    # Seqs are never reused and only trimming deletes changes, so every
+    # seq below this one, across all users, has been trimmed.
+    seq = await session.scalar(select(func.min(PageChange.seq)))
+    return seq or 0
+
+
+async def trim_changes(session: AsyncSession, before: datetime, batch_size: int) -> int:
+    # Oldest first, a batch per transaction, so what stays of a user's feed
+    # is always everything after some seq. Each batch only reads the
+    # `batch_size` oldest rows.
+    trimmed = 0
+    while True:
+        # Seeking from the oldest seq rather than scanning from the start
+        # keeps this a range read on the primary key.
+        oldest = (
+            select(PageChange.seq, PageChange.created)
+            .where(PageChange.seq >= select(func.min(PageChange.seq)).scalar_subquery())
+            .order_by(PageChange.seq)
+            .limit(batch_size)
+            .subquery()
+        )
+        last = await session.scalar(
+            select(func.max(oldest.c.seq)).where(oldest.c.created < before)
+        )
+        if last is None:
+            await session.commit()
+            return trimmed
+        result = await session.execute(delete(PageChange).where(PageChange.seq <= last))
+        await session.commit()
+        trimmed += result.rowcount
+
+
+async def changes_since(
+    session: AsyncSession, user_id: int, since: int, limit: int
+) -> Sequence[Row]:
+    # Rows of PAGE_CHANGE_COLUMNS, which encode like PageChangeDTO.
+    result = await session.execute(
+        select(*PAGE_CHANGE_COLUMNS)
+        .where((PageChange.user_id == user_id) & (PageChange.seq > since))
+        .order_by(PageChange.seq)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def event_stream(user_id: int, since: int, batch_size: int = 500) -> AsyncIterator[str]:
+    # Subscribe before the first read so nothing committed in between is
+    # missed, then send whatever is newer than `since` on every wakeup.
+    with notifier.subscribe(user_id) as waiter:
+        while True:
+            waiter.clear()
+            async with read_session_maker() as session:
+                changes = await changes_since(session, user_id, since, batch_size)
+            for change in changes:
+                since = change.seq
+                data = encode_json(change._asdict()).decode()
+                yield f"id: {change.seq}\nevent: change\ndata: {data}\n\n"
+            if len(changes) == batch_size:
+                continue
+            try:
+                await asyncio.wait_for(waiter.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
@@ -0,0 +1,52 @@
+from difflib import SequenceMatcher
+import json
+from typing import Iterable
+import zlib
+
+
+# A delta is a JSON list of ops, compressed with zlib. An `[i, j]` op copies
+# lines i..j of the base text and a string op inserts that text verbatim.
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode(), 9)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode()
+
+
+def encode(base: str, text: str) -> bytes:
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops: list[list[int] | str] = []
+    matcher = SequenceMatcher(None, base_lines, lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j1 != j2:
+            ops.append("".join(lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode(), 9)
+
+
+def splice(text: str, splices: Iterable[tuple[int, int, str]]) -> str:
+    # Replace text[start:end] with each replacement. Ranges index the
+    # original text, in code points, and must be in order without overlaps.
+    pieces = []
+    position = 0
+    for start, end, replacement in splices:
+        if not position <= start <= end <= len(text):
+            raise ValueError(f"Splice {start}:{end} overlaps another or is out of range")
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def apply(base: str, delta: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        op if isinstance(op, str) else "".join(base_lines[op[0] : op[1]])
+        for op in json.loads(zlib.decompress(delta))
+    )
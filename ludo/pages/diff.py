@@ -0,0 +1,82 @@
+"""Line and word diffs between page contents.
+
+A diff is a list of ops, each `[op, text]` with op one of "=" (unchanged),
+"-" (only in the old content) and "+" (only in the new one). Unchanged runs
+keep `context` lines or words next to each change; the rest of the run is
+a `["~", count]` op, with the number of lines or words left out. With every
+unchanged token kept (a negative `context`), the "=" and "-" texts joined
+give the old content, and the "=" and "+" texts joined give the new one.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+import re
+
+from pydantic import BaseModel
+
+from ludo.settings import settings
+
+
+MODES = ("line", "word")
+
+# Words, runs of whitespace, and single punctuation characters.
+WORD_PATTERN = re.compile(r"\w+|\s+|[^\w\s]", re.UNICODE)
+
+_executor = ThreadPoolExecutor(max_workers=settings.diff_workers, thread_name_prefix="diff")
+
+
+class PageDiff(BaseModel):
+    # `to_id` is None when diffing against the current page.
+    from_id: int
+    to_id: int | None = None
+    mode: str
+    # [op, text] pairs, or ["~", count] for skipped unchanged text.
+    ops: list[list[str | int]]
+
+
+def tokenize(content: str, mode: str) -> list[str]:
+    if mode == "line":
+        return content.splitlines(keepends=True)
+    return WORD_PATTERN.findall(content)
+
+
+def _unchanged(
+    tokens: list[str], first: bool, last: bool, context: int
+) -> list[tuple[str, str | int]]:
+    head = 0 if first else context
+    tail = 0 if last else context
+    if context < 0 or len(tokens) <= head + tail:
+        return [("=", "".join(tokens))]
+    ops: list[tuple[str, str | int]] = []
+    if head:
+        ops.append(("=", "".join(tokens[:head])))
+    ops.append(("~", len(tokens) - head - tail))
+    if tail:
+        ops.append(("=", "".join(tokens[-tail:])))
+    return ops
+
+
+def diff_ops(old: str, new: str, mode: str, context: int) -> list[tuple[str, str | int]]:
+    a, b = tokenize(old, mode), tokenize(new, mode)
+    opcodes = SequenceMatcher(None, a, b).get_opcodes()
+    ops: list[tuple[str, str | int]] = []
+    for n, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == "equal":
+            ops += _unchanged(a[i1:i2], n == 0, n == len(opcodes) - 1, context)
+            continue
+        if i1 < i2:
+            ops.append(("-", "".join(a[i1:i2])))
+        if j1 < j2:
+            ops.append(("+", "".join(b[j1:j2])))
+    return ops
+
+
+async def compute_diff(
+    old: str, new: str, mode: str, context: int
+) -> list[tuple[str, str | int]]:
+    # Small diffs are quicker inline than handed to a thread; large ones go
+    # to the pool so the event loop keeps serving other requests.
+    if len(old) + len(new) <= settings.diff_inline_max_size:
+        return diff_ops(old, new, mode, context)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, diff_ops, old, new, mode, context)
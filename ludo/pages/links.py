@@ -0,0 +1,186 @@
+"""Index of the links between pages.
+
+Content links to another page by its path, as `[[/parent/child]]` or
+`[[/parent/child|label]]`. Every link is a PageLink row, written when the
+content changes, so backlinks and broken links are index reads rather than
+scans over every page's content.
+
+A link keeps pointing at the page it resolved to by id, so moving or
+renaming that page doesn't break it even though the path written in the
+source is now stale. Links to a path with no page are broken until a page
+is created at, or moved to, that path.
+"""
+import re
+from typing import Iterable
+
+from pydantic import BaseModel
+from sqlalchemy import ForeignKey, Index, Select, delete, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ludo.db import Base
+
+from .models import Page
+
+
+LINK_PATTERN = re.compile(r"\[\[([^\[\]|]+)(?:\|[^\[\]]*)?\]\]")
+
+
+class PageLink(Base):
+    __tablename__ = "page_link"
+    source_id: Mapped[int] = mapped_column(ForeignKey("page.id"), primary_key=True)
+    # The path as written in the source, normalized.
+    target_path: Mapped[str] = mapped_column(primary_key=True)
+    # None while no page has been found at target_path.
+    target_id: Mapped[int | None]
+    author_id: Mapped[int]
+
+    # Both list in the order their endpoints page through.
+    __table_args__ = (
+        Index("ix_page_link_target", "target_id", "source_id"),
+        Index(
+            "ix_page_link_broken",
+            "author_id",
+            "target_path",
+            "source_id",
+            sqlite_where=text("target_id IS NULL"),
+        ),
+    )
+
+
+class Backlink(BaseModel):
+    id: int
+    title: str
+    friendly_title: str
+
+
+class BrokenLink(BaseModel):
+    source_id: int
+    title: str
+    friendly_title: str
+    target_path: str
+
+
+def normalize_path(path: str) -> str:
+    # Page paths are built from titles as they are, so segments are kept
+    # verbatim: [[/MyPage]] finds the page titled "MyPage". Only the space
+    # around the whole path and a missing, doubled or trailing "/" are
+    # forgiven.
+    return "/" + "/".join(segment for segment in path.strip().split("/") if segment)
+
+
+def parse_links(content: str) -> set[str]:
+    paths = {normalize_path(match) for match in LINK_PATTERN.findall(content)}
+    paths.discard("/")
+    return paths
+
+
+async def update_links(session: AsyncSession, page: Page) -> None:
+    # Only links added to or removed from the content are written; links
+    # that stay keep the page they resolved to.
+    paths = parse_links(page.content)
+    existing = set(
+        (
+            await session.scalars(
+                select(PageLink.target_path).where(PageLink.source_id == page.id)
+            )
+        ).all()
+    )
+    removed = existing - paths
+    if removed:
+        await session.execute(
+            delete(PageLink).where(
+                (PageLink.source_id == page.id) & PageLink.target_path.in_(removed)
+            )
+        )
+    added = paths - existing
+    if added:
+        targets = dict(
+            (
+                await session.execute(
+                    select(Page.path, Page.id).where(
+                        (Page.author_id == page.author_id) & Page.path.in_(added)
+                    )
+                )
+            ).all()
+        )
+        await session.execute(
+            insert(PageLink),
+            [
+                {
+                    "source_id": page.id,
+                    "target_path": path,
+                    "target_id": targets.get(path),
+                    "author_id": page.author_id,
+                }
+                for path in sorted(added)
+            ],
+        )
+
+
+async def add_links(session: AsyncSession, author_id: int, pages: Iterable[dict]) -> None:
+    # Links of freshly inserted pages, given as rows with `id` and
+    # `content`; resolve_links() is left to the caller.
+    rows = [
+        {"source_id": page["id"], "target_path": path, "author_id": author_id}
+        for page in pages
+        for path in sorted(parse_links(page["content"]))
+    ]
+    if rows:
+        await session.execute(insert(PageLink), rows)
+
+
+async def resolve_links(session: AsyncSession, author_id: int, path: str | None) -> None:
+    # Points broken links at the pages now at `path` and below it, after
+    # a create or a move; a path of None retries every broken link.
+    broken = (PageLink.author_id == author_id) & (PageLink.target_id == None)
+    if path is not None:
+        # The outer range is what ix_page_link_broken can seek.
+        broken &= (
+            (PageLink.target_path >= path)
+            & (PageLink.target_path < path + "0")
+            & ((PageLink.target_path == path) | (PageLink.target_path > path + "/"))
+        )
+    await session.execute(
+        update(PageLink)
+        .where(broken)
+        .values(
+            target_id=select(Page.id)
+            .where((Page.author_id == author_id) & (Page.path == PageLink.target_path))
+            .scalar_subquery()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def unlink_pages(session: AsyncSession, page_ids: Select) -> None:
+    # Before deleting pages: drop their own links and break the ones to them.
+    await session.execute(
+        delete(PageLink)
+        .where(PageLink.source_id.in_(page_ids))
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(
+        update(PageLink)
+        .where(PageLink.target_id.in_(page_ids))
+        .values(target_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backlinks(author_id: int, page_id: int) -> Select:
+    return (
+        select(Page.id, Page.title, Page.friendly_title)
+        .join(PageLink, PageLink.source_id == Page.id)
+        .where((PageLink.target_id == page_id) & (PageLink.author_id == author_id))
+        .order_by(PageLink.source_id)
+    )
+
+
+def broken_links(author_id: int) -> Select:
+    return (
+        select(PageLink.source_id, Page.title, Page.friendly_title, PageLink.target_path)
+        .join(Page, Page.id == PageLink.source_id)
+        .where((PageLink.author_id == author_id) & (PageLink.target_id == None))
+        .order_by(PageLink.target_path, PageLink.source_id)
+    )
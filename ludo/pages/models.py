@@ -1,13 +1,33 @@
 from __future__ import annotations
-from asyncio import TaskGroup
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
-from sqlalchemy import ForeignKey, select, inspect
+from typing import Any, Iterable, Optional, Sequence
+from sqlalchemy import (
+    ColumnElement,
+    ForeignKey,
+    Index,
+    Select,
+    case,
+    delete,
+    exists,
+    func,
+    inspect,
+    literal,
+    select,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, aliased, mapped_column, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from pydantic import BaseModel, Field
-from ludo.db import Base, dto_factory
+from ludo.db import Base, dto_columns, dto_factory
+from ludo.settings import settings
+from ludo.utils import LRUCache
+from . import delta, ranks
+
+
+# Fields of a PageWithChildren node that can be selected, besides `children`.
+TREE_FIELDS = ("id", "title", "content", "friendly_title", "parent_id")
 
 
 class Page(Base):
@@ -17,76 +37,404 @@ class Page(Base):
     friendly_title: Mapped[str]
     content: Mapped[str]
     parent_id: Mapped[int | None]
+    # Orders siblings; see ludo.pages.ranks. Placing a page only sets its
+    # own rank, picked between those of its new neighbours.
+    rank: Mapped[str]
+    # Materialized "/parent-title/child-title" path, kept in sync on every
+    # create, rename and move so by-path lookups are a single indexed read.
+    path: Mapped[str]
+    # Goes up by one with every change to the page; used for ETags, and
+    # checked against If-Match while the page is locked, see lock().
+    revision: Mapped[int] = mapped_column(default=1)
+
+    author_id: Mapped[int | None] = mapped_column(ForeignKey("user.id"), index=True)
+    author: Mapped[User] = relationship(back_populates="pages", lazy="noload")
 
-    author_id: Mapped[int | None] = mapped_column(ForeignKey("user.id"))
-    author: Mapped[User] = relationship(back_populates="pages", lazy="selectin")
+    # AUTOINCREMENT so an id, and with it an ETag, is never handed out twice.
+    __table_args__ = (
+        Index("ix_page_author_path", "author_id", "path", unique=True),
+        Index("ix_page_parent_rank", "parent_id", "rank"),
+        {"sqlite_autoincrement": True},
+    )
 
-    async def with_descendants(self, session: AsyncSession) -> PageWithChildren:
-        pwc = PageWithChildren.from_orm(self)
-        sr = await session.scalars(select(Page).where(Page.parent_id == self.id))
-        children = sr.all()
+    @property
+    def etag(self) -> str:
+        return f'"{self.id}-{self.revision}"'
+
+    async def lock(self, session: AsyncSession) -> None:
+        # A no-op write to the row: SQLite has one writer at a time, so from
+        # here to the commit nothing else changes the page, and the row is
+        # reloaded as it is now. Writes without a precondition then simply
+        # go last, and one with If-Match is checked against what it replaces.
+        await session.execute(
+            update(Page)
+            .where(Page.id == self.id)
+            .values(revision=Page.revision)
+            .execution_options(synchronize_session=False)
+        )
+        await session.refresh(self)
 
-        async with TaskGroup() as tg:
-            tasks = [tg.create_task(child.with_descendants(session)) for child in children]
+    @classmethod
+    async def tree_nodes(
+        cls,
+        session: AsyncSession,
+        root_id: int | None = None,
+        max_depth: int | None = None,
+        author_id: int | None = None,
+        fields: Sequence[str] = TREE_FIELDS,
+    ) -> list[dict[str, Any]]:
+        # Trees of plain dicts shaped like PageWithChildren, ready to encode.
+        # A root_id of None loads the whole forest; max_depth=0 loads only the
+        # roots. Nodes only get the given `fields`, and only those columns are
+        # read; in depth limited trees they also get has_children.
+        if root_id is None:
+            anchor = Page.parent_id == None
+        else:
+            anchor = Page.id == root_id
+        if author_id is not None:
+            anchor &= Page.author_id == author_id
+        tree = (
+            select(Page.id, literal(0).label("depth"))
+            .where(anchor)
+            .cte("tree", recursive=True)
+        )
+        # Children share their parent's author, so the step needs no author
+        # filter, which would also tempt SQLite into ix_page_author_id.
+        step = select(Page.id, tree.c.depth + 1).join(tree, Page.parent_id == tree.c.id)
+        if max_depth is not None:
+            step = step.where(tree.c.depth < max_depth)
+        tree = tree.union_all(step)
+
+        columns = [getattr(Page, name) for name in fields if name not in ("id", "parent_id")]
+        if max_depth is not None:
+            # Only the nodes at the cut need a lookup; above it the children
+            # are right there.
+            child = aliased(Page)
+            columns.append(
+                case(
+                    (tree.c.depth < max_depth, None),
+                    else_=exists().where(child.parent_id == Page.id),
+                ).label("has_children")
+            )
+        result = await session.execute(
+            select(Page.id, Page.parent_id, tree.c.depth, *columns)
+            .join(tree, Page.id == tree.c.id)
+            .order_by(tree.c.depth, Page.rank, Page.id)
+        )
 
-        pwc.children = [task.result() for task in tasks]
-        return pwc
+        # Rows arrive ordered by depth, so every parent is built before its
+        # children and the hierarchy can be assembled in one pass.
+        nodes: dict[int, dict[str, Any]] = {}
+        roots: list[dict[str, Any]] = []
+        for row in result:
+            values = row._asdict()
+            node = {name: values[name] for name in fields}
+            node["children"] = []
+            nodes[row.id] = node
+            if row.depth == 0:
+                roots.append(node)
+            else:
+                nodes[row.parent_id]["children"].append(node)
+            if max_depth is not None:
+                node["has_children"] = bool(row.has_children)
+                if row.depth > 0:
+                    nodes[row.parent_id]["has_children"] = True
+        return roots
+
+    @staticmethod
+    def children_of(author_id: int, parent_id: int | None) -> ColumnElement[bool]:
+        # Children share their parent's author; only roots need it spelled
+        # out, and leaving it off lets SQLite seek ix_page_parent_rank.
+        if parent_id is None:
+            return (Page.parent_id == None) & (Page.author_id == author_id)
+        return Page.parent_id == parent_id
+
+    @classmethod
+    async def rank_for(
+        cls,
+        session: AsyncSession,
+        author_id: int,
+        parent_id: int | None,
+        after_id: int | None = None,
+        before_id: int | None = None,
+    ) -> str:
+        # A rank placing a page under `parent_id` right after the sibling
+        # `after_id`, right before `before_id`, between the two, or last.
+        siblings = Page.children_of(author_id, parent_id)
+
+        async def sibling_rank(page_id: int) -> str:
+            rank = await session.scalar(select(Page.rank).where(siblings & (Page.id == page_id)))
+            if rank is None:
+                raise ValueError(f"Page {page_id} is not a child of the new parent")
+            return rank
+
+        low = await sibling_rank(after_id) if after_id is not None else None
+        high = await sibling_rank(before_id) if before_id is not None else None
+        if after_id is not None and before_id is None:
+            high = await session.scalar(
+                select(func.min(Page.rank)).where(siblings & (Page.rank > low))
+            )
+        elif before_id is not None and after_id is None:
+            low = await session.scalar(
+                select(func.max(Page.rank)).where(siblings & (Page.rank < high))
+            )
+        elif after_id is None:
+            low = await session.scalar(select(func.max(Page.rank)).where(siblings))
+        elif low >= high:
+            raise ValueError(f"Page {after_id} does not come before page {before_id}")
+        return ranks.rank_between(low, high)
 
     async def is_ancestor_of(self, page: Page, session: AsyncSession) -> bool:
-        children = (
-            await session.scalars(select(Page).where(Page.parent_id == self.id))
-        ).all()
-        if not children:
+        # Walk up from `page` rather than down from `self`, so the cost is
+        # bounded by the depth of `page` and not the size of our subtree.
+        if page.parent_id is None:
             return False
+        ancestors = (
+            select(Page.id, Page.parent_id)
+            .where(Page.id == page.parent_id)
+            .cte("ancestors", recursive=True)
+        )
+        ancestors = ancestors.union(
+            select(Page.id, Page.parent_id).join(
+                ancestors, Page.id == ancestors.c.parent_id
+            )
+        )
+        return await session.scalar(
+            select(exists().where(ancestors.c.id == self.id))
+        )
 
-        if any(child.id == page.id for child in children):
-            return True
+    async def get_path(self, session: AsyncSession) -> Path:
+        return Path(self.path)
 
-        for child in children:
-            if await child.is_ancestor_of(page):
-                return True
+    @staticmethod
+    def slugify(friendly_title: str) -> str:
+        # "/" separates path segments, so it can't be part of a title.
+        return friendly_title.replace(" ", "-").replace(",", "").replace("/", "").lower()
 
-        return False
+    @staticmethod
+    def child_path(parent: Page | None, title: str) -> str:
+        prefix = parent.path if parent is not None else ""
+        return f"{prefix}/{title}"
 
-    async def get_path(self, session: AsyncSession) -> Path:
-        page = self
-        parts = []
-        while True:
-            parts.append(page.title)
-            if page.parent_id is None:
-                break
-            page = await session.get(Page, page.parent_id)
-        path = '/' / Path(*reversed(parts))
-        return path
+    @classmethod
+    async def path_exists(cls, session: AsyncSession, author_id: int, path: str) -> bool:
+        return await session.scalar(
+            select(exists().where((Page.author_id == author_id) & (Page.path == path)))
+        )
+
+    def in_subtree(self):
+        # This page and its descendants. Descendants are exactly the paths in
+        # [path + "/", path + "0"), since "0" is the character right after "/".
+        return (Page.author_id == self.author_id) & (
+            (Page.path == self.path)
+            | ((Page.path > self.path + "/") & (Page.path < self.path + "0"))
+        )
+
+    def subtree_ids(self) -> Select:
+        # This page and its descendants by parent_id, like tree_nodes, so
+        # deletes never rely on paths to tell whose subtree a page is in.
+        subtree = select(Page.id).where(Page.id == self.id).cte("subtree", recursive=True)
+        subtree = subtree.union_all(
+            select(Page.id).join(subtree, Page.parent_id == subtree.c.id)
+        )
+        return select(subtree.c.id)
+
+    async def move_path(self, session: AsyncSession, path: str) -> None:
+        # Rewrite our path and the prefix of every descendant's path in one
+        # statement.
+        await session.execute(
+            update(Page)
+            .where(self.in_subtree())
+            .values(path=path + func.substr(Page.path, len(self.path) + 1))
+            .execution_options(synchronize_session=False)
+        )
+        set_committed_value(self, "path", path)
+
+    async def delete_subtree(self, session: AsyncSession) -> None:
+        # Two statements whatever the size of the subtree; nothing is loaded.
+        ids = self.subtree_ids()
+        await session.execute(
+            delete(PageVersion)
+            .where(PageVersion.page_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            delete(Page).where(Page.id.in_(ids)).execution_options(synchronize_session=False)
+        )
 
 
 from ludo.auth import User
 
 
+# Every KEYFRAME_INTERVAL-th version of a page stores its full content; the
+# ones in between store a delta against that keyframe, so rebuilding any
+# version needs at most two rows.
+KEYFRAME_INTERVAL = 16
+
+# Rebuilt contents by version id. Versions never change once written (a
+# rebase only changes how they are stored), so entries are never stale.
+version_contents: LRUCache[int, str] = LRUCache(max_size=512)
+
+# Encoded PageDiffs by (from version id, to version id, page revision, mode,
+# context); the revision is only set for diffs against the current page.
+version_diffs: LRUCache[tuple[int, int | None, int | None, str, int], bytes] = LRUCache(
+    max_size=settings.diff_cache_size
+)
+
+
 class PageVersion(Base):
     __tablename__ = "page_version"
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str]
     friendly_title: Mapped[str]
-    content: Mapped[str]
+    # Compressed content for keyframes (base_id is None), otherwise a
+    # compressed delta against the keyframe base_id points to.
+    data: Mapped[bytes]
+    base_id: Mapped[int | None] = mapped_column(ForeignKey("page_version.id"), index=True)
     page_id: Mapped[int] = mapped_column(ForeignKey("page.id"))
     created: Mapped[datetime] = mapped_column(default=datetime.utcnow)
 
+    # AUTOINCREMENT so an id, and with it an ETag or cached content, is
+    # never handed out twice.
+    __table_args__ = (
+        Index("ix_page_version_page_created", "page_id", "created"),
+        {"sqlite_autoincrement": True},
+    )
+
     @classmethod
-    def from_page(cls, page: Page) -> PageVersion:
+    async def from_page(cls, page: Page, session: AsyncSession) -> PageVersion:
         page_version = PageVersion(
             title=page.title,
             friendly_title=page.friendly_title,
-            content=page.content,
             page_id=page.id
         )
+        keyframe = await session.scalar(
+            select(PageVersion)
+            .where((PageVersion.page_id == page.id) & (PageVersion.base_id == None))
+            .order_by(PageVersion.id.desc())
+            .limit(1)
+        )
+        if keyframe is not None:
+            dependents = await session.scalar(
+                select(func.count()).where(PageVersion.base_id == keyframe.id)
+            )
+            if dependents < KEYFRAME_INTERVAL - 1:
+                contents = await PageVersion.load_contents(session, [keyframe])
+                page_version.base_id = keyframe.id
+                page_version.data = delta.encode(contents[keyframe.id], page.content)
+                return page_version
+
+        page_version.data = delta.compress(page.content)
         return page_version
 
+    @classmethod
+    async def load_contents(
+        cls, session: AsyncSession, versions: Iterable[PageVersion]
+    ) -> dict[int, str]:
+        contents: dict[int, str] = {}
+        pending: list[PageVersion] = []
+        for version in versions:
+            content = version_contents.get(version.id)
+            if content is None and version.base_id is None:
+                content = delta.decompress(version.data)
+                version_contents.set(version.id, content)
+            if content is None:
+                pending.append(version)
+            else:
+                contents[version.id] = content
+
+        bases: dict[int, str] = {}
+        for version in pending:
+            base = contents.get(version.base_id)
+            if base is None:
+                base = version_contents.get(version.base_id)
+            if base is not None:
+                bases[version.base_id] = base
+        missing = {version.base_id for version in pending} - bases.keys()
+        if missing:
+            rows = await session.execute(
+                select(PageVersion.id, PageVersion.data).where(PageVersion.id.in_(missing))
+            )
+            for base_id, data in rows:
+                bases[base_id] = delta.decompress(data)
+                version_contents.set(base_id, bases[base_id])
+
+        for version in pending:
+            content = delta.apply(bases[version.base_id], version.data)
+            version_contents.set(version.id, content)
+            contents[version.id] = content
+        return contents
+
+    @classmethod
+    async def rebase_dependents(
+        cls, session: AsyncSession, removed_ids: Select | list[int]
+    ) -> None:
+        # Must run before the versions in `removed_ids` are deleted. Any
+        # surviving version whose keyframe is being removed is re-encoded: the
+        # oldest one becomes the new keyframe and the rest point to it.
+        orphans = (
+            await session.scalars(
+                select(PageVersion)
+                .where(PageVersion.base_id.in_(removed_ids))
+                .where(PageVersion.id.not_in(removed_ids))
+                .order_by(PageVersion.id)
+            )
+        ).all()
+        if not orphans:
+            return
+
+        contents = await PageVersion.load_contents(session, orphans)
+        new_keyframes: dict[int, PageVersion] = {}
+        for version in orphans:
+            keyframe = new_keyframes.get(version.base_id)
+            if keyframe is None:
+                new_keyframes[version.base_id] = version
+                version.base_id = None
+                version.data = delta.compress(contents[version.id])
+            else:
+                version.base_id = keyframe.id
+                version.data = delta.encode(contents[keyframe.id], contents[version.id])
+        await session.flush()
+
+    @classmethod
+    async def prune(cls, session: AsyncSession, page_id: int, keep: int) -> None:
+        # Drop all but the newest `keep` versions of a page. Only the few
+        # survivors that depended on a dropped keyframe are loaded.
+        removed = (
+            select(PageVersion.id)
+            .where(PageVersion.page_id == page_id)
+            .order_by(PageVersion.created.desc(), PageVersion.id.desc())
+            .offset(keep)
+        )
+        await PageVersion.rebase_dependents(session, removed)
+        await session.execute(
+            delete(PageVersion)
+            .where(PageVersion.id.in_(removed))
+            .execution_options(synchronize_session=False)
+        )
+
+    def to_dict(self, content: str) -> dict[str, Any]:
+        # Shaped like PageVersionDTO.
+        return {
+            "id": self.id,
+            "title": self.title,
+            "friendly_title": self.friendly_title,
+            "page_id": self.page_id,
+            "created": self.created,
+            "content": content,
+        }
+
+
+PageVersionDTO = dto_factory("PageVersionDTO", PageVersion, exclude=["data", "base_id"])
 
-PageVersionDTO = dto_factory("PageVersionDTO", PageVersion)
+
+class PageVersionDTO(PageVersionDTO):
+    content: str
 
 
-PageInDTO = dto_factory("PageInDTO", Page, exclude=["id", "author_id", "author"])
+PageInDTO = dto_factory(
+    "PageInDTO", Page, exclude=["id", "path", "rank", "revision", "author_id", "author"]
+)
 
 
 # Kind of a hack, but it seems to work.
@@ -95,16 +443,49 @@ class PageInDTO(PageInDTO):
     title: str | None = None
 
 
-PageOutDTO = dto_factory("PageOutDTO", Page, exclude=["author_id", "author"])
+PageOutDTO = dto_factory(
+    "PageOutDTO", Page, exclude=["path", "rank", "revision", "author_id", "author"]
+)
+PAGE_OUT_COLUMNS = dto_columns(PageOutDTO, Page)
 
 
 class PageWithChildren(BaseModel):
     id: int | None = None
     title: str | None = None
-    content: str
+    content: str | None = None
     friendly_title: str | None = None
     parent_id: int | None = None
     children: list[PageWithChildren] = Field(default_factory=list)
+    # Only set in depth limited trees, where `children` may be cut off.
+    has_children: bool | None = None
 
     class Config:
         orm_mode = True
+
+
+class Splice(BaseModel):
+    # Replaces content[start:end], counted in code points, with `text`.
+    start: int
+    end: int
+    text: str = ""
+
+
+class PagePatch(BaseModel):
+    # The revision the splices were made against, from the page's ETag or
+    # the previous patch; splices are in order and don't overlap.
+    base_revision: int
+    splices: list[Splice]
+
+
+class PageRevision(BaseModel):
+    id: int
+    revision: int
+
+
+class SearchResult(BaseModel):
+    id: int
+    title: str
+    friendly_title: str
+    parent_id: int | None = None
+    snippet: str
+    score: float
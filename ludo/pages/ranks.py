@@ -0,0 +1,125 @@
+"""Rank keys for ordering siblings.
+
+A key sorts bytewise (SQLite's default collation) and there is always a
+key between any two, so placing a page never renumbers its siblings.
+
+Keys are an integer part followed by an optional fraction, as in
+https://observablehq.com/@dgreensp/implementing-fractional-indexing: the
+integer part's first character encodes its length ("a0".."az", then
+"b00".., and "Z0".. downwards), so appending keeps keys short, and
+inserting between two neighbours extends the fraction.
+"""
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+FIRST = "a0"
+SMALLEST_INTEGER = "A" + "0" * 26
+
+
+def _midpoint(a: str, b: str | None) -> str:
+    # A fraction strictly between a and b; "" is the smallest fraction and
+    # None the end. Neither may end in "0".
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid rank key head {head!r}")
+
+
+def _split(key: str) -> tuple[str, str]:
+    length = _integer_length(key[0])
+    if len(key) < length or key[length:].endswith("0"):
+        raise ValueError(f"Invalid rank key {key!r}")
+    return key[:length], key[length:]
+
+
+def _increment(integer: str) -> str | None:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) + 1
+        if d < len(DIGITS):
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = "0"
+    if head == "Z":
+        return "a0"
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append("0")
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def _decrement(integer: str) -> str | None:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) - 1
+        if d >= 0:
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def rank_between(before: str | None, after: str | None) -> str:
+    """A key sorting after `before` and before `after`; None is either end."""
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"Rank {before!r} is not before {after!r}")
+    if before is None and after is None:
+        return FIRST
+    if before is None:
+        integer, fraction = _split(after)
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint("", fraction)
+        if integer < after:
+            return integer
+        return _decrement(integer)
+    if after is None:
+        integer, fraction = _split(before)
+        return _increment(integer) or integer + _midpoint(fraction, None)
+    integer_before, fraction_before = _split(before)
+    integer_after, fraction_after = _split(after)
+    if integer_before == integer_after:
+        return integer_before + _midpoint(fraction_before, fraction_after)
+    integer = _increment(integer_before)
+    if integer is not None and integer < after:
+        return integer
+    return integer_before + _midpoint(fraction_before, None)
+
+
+def is_valid_rank(key: str) -> bool:
+    if not key or any(char not in DIGITS for char in key):
+        return False
+    try:
+        _split(key)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,293 @@
+"""Background thinning of old page versions.
+
+The policy is a list of tiers, `settings.version_retention`, such as
+
+    1d:all,7d:1h,*:1d
+
+which keeps every version from the last day, then one per hour up to a
+week old, then one per day. Each tier is `<age>:<spacing>` and covers the
+versions younger than `<age>` and not covered by an earlier tier; `*` is
+any age. A tier keeps the newest version in each spacing-sized slot of
+time, so a slot's survivor stays the same from one run to the next.
+Versions older than the last tier's age are dropped.
+
+Pruning runs in transactions of at most `version_retention_batch_size`
+deleted versions, so writers never wait long on it. The same runs trim
+change feed entries older than `settings.change_retention`. To run it once:
+
+    python -m ludo.pages.retention
+"""
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+import time
+from typing import Sequence
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ludo import metrics
+from ludo.db import sqlalchemy_config
+from ludo.settings import settings
+
+from .changes import trim_changes
+from .models import PageVersion, version_contents, version_diffs
+
+
+logger = logging.getLogger("ludo.retention")
+
+UNITS = {
+    "s": timedelta(seconds=1),
+    "m": timedelta(minutes=1),
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+    "w": timedelta(weeks=1),
+}
+
+# Slots are counted from here, not from local time.
+EPOCH = datetime(1970, 1, 1)
+
+# Pages read per transaction while looking for versions to drop.
+PAGE_BATCH_SIZE = 100
+
+# (age, spacing): an age of None is any age, a spacing of None keeps all.
+Tier = tuple[timedelta | None, timedelta | None]
+
+
+@dataclass
+class RetentionReport:
+    pages: int = 0
+    versions: int = 0
+    bytes: int = 0
+    changes: int = 0
+    seconds: float = 0.0
+
+
+_totals = RetentionReport()
+_runs = 0
+_task: asyncio.Task | None = None
+
+
+def parse_duration(text: str) -> timedelta:
+    text = text.strip()
+    if text[:-1].isdigit() and int(text[:-1]) > 0 and text[-1:] in UNITS:
+        return int(text[:-1]) * UNITS[text[-1:]]
+    raise ValueError(f"Invalid duration {text!r}, expected e.g. 30m, 12h or 7d")
+
+
+def parse_policy(spec: str) -> list[Tier]:
+    tiers: list[Tier] = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        age, sep, spacing = part.partition(":")
+        if not sep:
+            raise ValueError(
+                f"Invalid retention tier {part.strip()!r}, expected <age>:<spacing>"
+            )
+        if tiers and tiers[-1][0] is None:
+            raise ValueError("Only the last retention tier may have an age of *")
+        tiers.append(
+            (
+                None if age.strip() == "*" else parse_duration(age),
+                None if spacing.strip() == "all" else parse_duration(spacing),
+            )
+        )
+    return tiers
+
+
+def versions_to_drop(
+    versions: Sequence[Row], tiers: Sequence[Tier], now: datetime
+) -> list[int]:
+    # `versions` are one page's (id, created, base_id) rows, newest first.
+    # The newest keyframe always stays: new versions may be encoded against
+    # it by a request that has already read it.
+    newest_keyframe = next((v.id for v in versions if v.base_id is None), None)
+    drop = []
+    slots: set[tuple[int, int]] = set()
+    for version in versions:
+        age = now - version.created
+        tier = next(
+            (i for i, (max_age, _) in enumerate(tiers) if max_age is None or age < max_age),
+            None,
+        )
+        if tier is not None:
+            spacing = tiers[tier][1]
+            if spacing is None:
+                continue
+            slot = (tier, (version.created - EPOCH) // spacing)
+            if slot not in slots:
+                slots.add(slot)
+                continue
+        if version.id != newest_keyframe:
+            drop.append(version.id)
+    return drop
+
+
+async def _data_size(session: AsyncSession, page_id: int) -> int:
+    return await session.scalar(
+        select(func.coalesce(func.sum(func.length(PageVersion.data)), 0)).where(
+            PageVersion.page_id == page_id
+        )
+    )
+
+
+async def _prune_page(
+    session: AsyncSession, page_id: int, drop: list[int], report: RetentionReport
+) -> None:
+    # Newest first, so the dependents of an old keyframe are mostly gone by
+    # the time it is, and few survivors need re-encoding.
+    size = await _data_size(session, page_id)
+    batch_size = settings.version_retention_batch_size
+    for start in range(0, len(drop), batch_size):
+        ids = drop[start:start + batch_size]
+        await PageVersion.rebase_dependents(session, ids)
+        await session.execute(
+            delete(PageVersion)
+            .where(PageVersion.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        new_size = await _data_size(session, page_id)
+        await session.commit()
+        for id in ids:
+            version_contents.pop(id)
+        version_diffs.clear()
+        report.versions += len(ids)
+        report.bytes += size - new_size
+        size = new_size
+    report.pages += 1
+
+
+async def apply_retention(
+    session: AsyncSession, tiers: Sequence[Tier], now: datetime | None = None
+) -> RetentionReport:
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    report = RetentionReport()
+    candidates = select(PageVersion.page_id)
+    if tiers and tiers[0][1] is None and tiers[0][0] is not None:
+        # Pages whose versions all fall in a keep-all first tier are skipped.
+        candidates = candidates.where(PageVersion.created < now - tiers[0][0])
+
+    last_page_id = 0
+    while True:
+        page_ids = (
+            await session.scalars(
+                candidates.where(PageVersion.page_id > last_page_id)
+                .group_by(PageVersion.page_id)
+                .order_by(PageVersion.page_id)
+                .limit(PAGE_BATCH_SIZE)
+            )
+        ).all()
+        if not page_ids:
+            break
+        last_page_id = page_ids[-1]
+        for page_id in page_ids:
+            versions = (
+                await session.execute(
+                    select(PageVersion.id, PageVersion.created, PageVersion.base_id)
+                    .where(PageVersion.page_id == page_id)
+                    .order_by(PageVersion.created.desc(), PageVersion.id.desc())
+                )
+            ).all()
+            drop = versions_to_drop(versions, tiers, now)
+            if drop:
+                await _prune_page(session, page_id, drop, report)
+        # Don't keep a read transaction open between batches.
+        await session.commit()
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+async def run_retention(tiers: Sequence[Tier]) -> RetentionReport:
+    global _runs
+    started = time.perf_counter()
+    async with sqlalchemy_config.session_maker() as session:
+        report = await apply_retention(session, tiers) if tiers else RetentionReport()
+        if settings.change_retention:
+            report.changes = await trim_changes(
+                session,
+                datetime.utcnow() - timedelta(seconds=settings.change_retention),
+                settings.version_retention_batch_size,
+            )
+    report.seconds = time.perf_counter() - started
+    _runs += 1
+    _totals.pages += report.pages
+    _totals.versions += report.versions
+    _totals.bytes += report.bytes
+    _totals.changes += report.changes
+    logger.info(
+        "Retention removed %d versions (%d bytes) from %d pages and %d changes in %.1fs",
+        report.versions,
+        report.bytes,
+        report.pages,
+        report.changes,
+        report.seconds,
+    )
+    return report
+
+
+async def _retention_loop(tiers: Sequence[Tier]) -> None:
+    while True:
+        try:
+            await run_retention(tiers)
+        except Exception:
+            logger.exception("Version retention run failed")
+        await asyncio.sleep(settings.version_retention_interval)
+
+
+def _collect_metrics() -> list[str]:
+    lines = []
+    for name, help_text, value in (
+        ("runs_total", "Retention runs completed.", _runs),
+        ("versions_total", "Page versions removed.", _totals.versions),
+        ("bytes_total", "Bytes of version data reclaimed.", _totals.bytes),
+        ("changes_total", "Change feed entries trimmed.", _totals.changes),
+    ):
+        lines += [
+            f"# HELP ludo_version_retention_{name} {help_text}",
+            f"# TYPE ludo_version_retention_{name} counter",
+            f"ludo_version_retention_{name} {value}",
+        ]
+    return lines
+
+
+metrics.collectors.append(_collect_metrics)
+
+
+async def retention_on_startup() -> None:
+    global _task
+    # Parsed here so a bad policy stops startup rather than the first run.
+    tiers = parse_policy(settings.version_retention)
+    if tiers or settings.change_retention:
+        _task = asyncio.create_task(_retention_loop(tiers))
+
+
+async def retention_on_shutdown() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _task
+        _task = None
+
+
+async def main() -> None:
+    tiers = parse_policy(settings.version_retention)
+    if not tiers and not settings.change_retention:
+        print("No retention policy set (LUDO_VERSION_RETENTION, LUDO_CHANGE_RETENTION)")
+        return
+    report = await run_retention(tiers)
+    print(
+        f"Removed {report.versions} versions ({report.bytes} bytes) "
+        f"from {report.pages} pages and {report.changes} changes in {report.seconds:.1f}s"
+    )
+    await sqlalchemy_config.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,22 @@
-import asyncio
+from datetime import datetime
 from pathlib import Path
 import logging
+from typing import Any, Callable, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import exists, func, select, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlite.utils.serialization import encode_json
 from starlite import (
     Controller,
     HTTPException,
     NotFoundException,
+    Parameter,
     Partial,
+    Request,
+    Response,
+    Stream,
+    ValidationException,
     delete,
     get,
     patch,
@@ -17,57 +25,192 @@ from starlite import (
     status_codes,
 )
 
-from ludo.auth import User
-
+from ludo.auth import UserOutDTO
+from ludo.db import read_only_session
+from ludo.utils import RawJSONResponse, decode_cursor, encode_cursor, etag_matches
+
+from . import delta
+from .bulk import ImportSummary, PageImporter, export_ndjson
+from .diff import MODES, PageDiff, compute_diff
+from .changes import (
+    ChangeSet,
+    changes_since,
+    event_stream,
+    head_seq,
+    oldest_seq,
+    record_change,
+    record_changes,
+)
+from .links import (
+    Backlink,
+    BrokenLink,
+    PageLink,
+    backlinks,
+    broken_links,
+    resolve_links,
+    unlink_pages,
+    update_links,
+)
 from .models import (
+    PAGE_OUT_COLUMNS,
+    TREE_FIELDS,
     Page,
     PageInDTO,
     PageOutDTO,
+    PagePatch,
+    PageRevision,
     PageVersion,
     PageVersionDTO,
     PageWithChildren,
+    SearchResult,
+    version_diffs,
 )
+from .search import search_pages
+from .tree_cache import TreeCacheStats, invalidate_tree, tree_cache
 
 
 logger = logging.getLogger()
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+ETAG_HEADER = "ETag"
+
+
+async def _update_path(
+    session: AsyncSession, page: Page, parent_page: Page | None, title: str
+) -> None:
+    new_path = Page.child_path(parent_page, title)
+    if new_path == page.path:
+        return
+    if await Page.path_exists(session, page.author_id, new_path):
+        raise HTTPException(
+            status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="A page with this path already exists",
+        )
+    await page.move_path(session, new_path)
+
+
+def _check_title(title: str) -> None:
+    if "/" in title:
+        raise HTTPException(
+            status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="`title` must not contain /",
+        )
+
+
+def _user_etag(user_id: int, seq: int) -> str:
+    # Every write to a user's pages records a change, so the user's latest
+    # change seq is a revision of everything listed under them.
+    return f'"u{user_id}-{seq}"'
+
+
+def _not_modified(request: Request, etag: str) -> Response | None:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            content=None,
+            status_code=status_codes.HTTP_304_NOT_MODIFIED,
+            headers={ETAG_HEADER: etag},
+        )
+    return None
+
+
+async def _lock_page(request: Request, session: AsyncSession, page: Page) -> None:
+    # Every write to a page starts here. Only a request that sends If-Match
+    # is refused when the page has changed since the client fetched it.
+    await page.lock(session)
+    header = request.headers.get("if-match")
+    if header is not None and not etag_matches(header, page.etag, weak=False):
+        raise HTTPException(
+            status_code=status_codes.HTTP_412_PRECONDITION_FAILED,
+            detail="Page has changed since it was fetched",
+        )
+
+
+async def _check_not_trimmed(session: AsyncSession, since: int) -> None:
+    if since and since + 1 < await oldest_seq(session):
+        raise HTTPException(
+            status_code=status_codes.HTTP_410_GONE,
+            detail="Changes since this seq have been trimmed, reload the pages",
+        )
+
+
+def _paginated(
+    rows: Sequence[Any],
+    limit: int | None,
+    serialize: Callable[[Any], Any],
+    cursor_for: Callable[[Any], str],
+    etag: str | None = None,
+) -> Response:
+    # Callers fetch `limit + 1` rows; the extra row only tells us there is a
+    # next page, and the cursor points just past the last row we return.
+    # `serialize` returns plain data shaped like the endpoint's DTO.
+    headers = {ETAG_HEADER: etag} if etag is not None else {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        # A limit of 0 or less returns nothing, and has nothing to resume from.
+        if rows:
+            headers[NEXT_CURSOR_HEADER] = cursor_for(rows[-1])
+    return RawJSONResponse(encode_json([serialize(row) for row in rows]), headers=headers)
+
 
 class PagesController(Controller):
     path = "/api/pages"
 
-    @get("/")
+    @get("/", dependencies=read_only_session)
     async def get_pages(
         self,
-        user: User,
+        request: Request,
+        user: UserOutDTO,
         session: AsyncSession,
         skip: int | None = None,
         limit: int | None = None,
-    ) -> list[PageOutDTO]:
-        sr = await session.scalars(
-            select(Page)
-            .where(Page.author_id == user.id)
-            .offset(skip)
-            .limit(limit)
-            .order_by(Page.id)
+        cursor: str | None = None,
+    ) -> Response[list[PageOutDTO]]:
+        etag = _user_etag(user.id, await head_seq(session, user.id))
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        if limit is not None and limit < 0:
+            # As SQLite's own LIMIT -1, which this endpoint used to pass through.
+            limit = None
+        stmt = select(*PAGE_OUT_COLUMNS).where(Page.author_id == user.id).order_by(Page.id)
+        if cursor is not None:
+            (last_id,) = decode_cursor(cursor, "id")
+            stmt = stmt.where(Page.id > last_id)
+        elif skip:
+            stmt = stmt.offset(skip)
+        if limit is not None:
+            stmt = stmt.limit(limit + 1)
+
+        rows = (await session.execute(stmt)).all()
+        return _paginated(
+            rows,
+            limit,
+            Row._asdict,
+            lambda row: encode_cursor(id=row.id),
+            etag,
         )
-        return sr.all()
 
     @post("/")
     async def create_page(
         self,
-        user: User,
+        user: UserOutDTO,
         session: AsyncSession,
         data: PageInDTO,
         parent_id: int | None = None,
     ) -> PageOutDTO:
-        user_for_session = await session.get(User, user.id)
-        page = Page(**data.dict())
+        page = Page(**data.dict(), author_id=user.id)
 
-        if parent_id is not None and await session.get(Page, parent_id) is None:
-            raise HTTPException(
-                status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Parent ID does not exist",
-            )
+        if parent_id is not None:
+            page.parent_id = parent_id
+        parent_page = None
+        if page.parent_id is not None:
+            parent_page = await session.get(Page, page.parent_id)
+            if parent_page is None or parent_page.author_id != user.id:
+                raise HTTPException(
+                    status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Parent ID does not exist",
+                )
 
         if not page.title and not page.friendly_title:
             raise HTTPException(
@@ -76,67 +219,226 @@ class PagesController(Controller):
             )
 
         if not page.title and page.friendly_title:
-            page.title = page.friendly_title.replace(" ", "-").replace(",", "").lower()
+            page.title = Page.slugify(page.friendly_title)
         elif not page.friendly_title and page.title:
             page.friendly_title = page.title
+        _check_title(page.title)
 
-        if parent_id is not None:
-            page.parent_id = parent_id
-        user_for_session.pages.append(page)
+        page.path = Page.child_path(parent_page, page.title)
+        page.rank = await Page.rank_for(session, user.id, page.parent_id)
+        if await Page.path_exists(session, user.id, page.path):
+            raise HTTPException(
+                status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="A page with this path already exists",
+            )
+
+        session.add(page)
+        await session.flush()
+        await update_links(session, page)
+        await resolve_links(session, user.id, page.path)
+        record_change(
+            session,
+            user.id,
+            page.id,
+            "created",
+            title=page.title,
+            friendly_title=page.friendly_title,
+            parent_id=page.parent_id,
+            revision=page.revision,
+        )
+        invalidate_tree(session, user.id, page.path)
         await session.commit()
         await session.refresh(page)
         return page
 
-    @get("/tree")
-    async def get_tree(
-        self, session: AsyncSession, id: int | None = None
-    ) -> list[PageWithChildren]:
-        if id is None:
-            stmt = select(Page).where(Page.parent_id == None)
-        else:
-            stmt = select(Page).where(Page.id == id)
-        scalar_result = await session.scalars(stmt)
-        root_pages = scalar_result.all()
+    @post("/import")
+    async def import_pages(
+        self, request: Request, user: UserOutDTO, session: AsyncSession
+    ) -> ImportSummary:
+        importer = PageImporter(session, user.id)
+        return await importer.feed(request.stream())
+
+    @get("/export")
+    async def export_pages(self, user: UserOutDTO, versions: bool = False) -> Stream:
+        return Stream(
+            iterator=export_ndjson(user.id, versions), media_type="application/x-ndjson"
+        )
+
+    @get("/changes", dependencies=read_only_session)
+    async def get_changes(
+        self, user: UserOutDTO, session: AsyncSession, since: int = 0, limit: int = 500
+    ) -> Response[ChangeSet]:
+        await _check_not_trimmed(session, since)
+        changes = await changes_since(session, user.id, since, limit)
+        seq = changes[-1].seq if changes else await head_seq(session, user.id)
+        return RawJSONResponse(
+            encode_json({"seq": seq, "changes": [change._asdict() for change in changes]})
+        )
+
+    @get("/changes/stream", dependencies=read_only_session)
+    async def stream_changes(
+        self,
+        request: Request,
+        user: UserOutDTO,
+        session: AsyncSession,
+        since: int | None = None,
+    ) -> Stream:
+        # Reconnecting EventSource clients resume from Last-Event-ID; new
+        # ones only get changes from now on.
+        if since is None:
+            last_event_id = request.headers.get("last-event-id", "")
+            if last_event_id.isdigit():
+                since = int(last_event_id)
+            else:
+                since = await head_seq(session, user.id)
+        await _check_not_trimmed(session, since)
+        return Stream(
+            iterator=event_stream(user.id, since),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
 
-        async with asyncio.TaskGroup() as tg:
-            tasks = [
-                tg.create_task(page.with_descendants(session)) for page in root_pages
-            ]
+    @get("/search", dependencies=read_only_session)
+    async def search(
+        self,
+        user: UserOutDTO,
+        session: AsyncSession,
+        q: str,
+        limit: int = 20,
+        cursor: str | None = None,
+    ) -> Response[list[SearchResult]]:
+        after = None
+        if cursor is not None:
+            after = decode_cursor(cursor, "score", "id")
+        rows = []
+        if q.strip():
+            rows = await search_pages(session, user.id, q, limit + 1, after)
+        return _paginated(
+            rows,
+            limit,
+            Row._asdict,
+            lambda row: encode_cursor(score=row.score, id=row.id),
+        )
 
-        result = [task.result() for task in tasks]
-        return result
+    @get("/tree", dependencies=read_only_session)
+    async def get_tree(
+        self,
+        request: Request,
+        user: UserOutDTO,
+        session: AsyncSession,
+        id: int | None = None,
+        depth: int | None = None,
+        field_names: str | None = Parameter(query="fields", default=None),
+    ) -> Response[list[PageWithChildren]]:
+        # `depth` cuts the tree below that many levels, marking every node
+        # with has_children; `fields` is a comma separated subset of
+        # TREE_FIELDS, e.g. fields=id,title,parent_id for navigation.
+        if depth is not None and depth < 0:
+            raise ValidationException(detail="depth must not be negative")
+        selected = TREE_FIELDS
+        if field_names is not None:
+            names = {name.strip() for name in field_names.split(",") if name.strip()}
+            unknown = names - set(TREE_FIELDS)
+            if unknown:
+                raise ValidationException(
+                    detail=f"Unknown tree fields: {', '.join(sorted(unknown))}"
+                )
+            selected = tuple(name for name in TREE_FIELDS if name in names)
+
+        generation = tree_cache.generation(user.id)
+        etag = _user_etag(user.id, await head_seq(session, user.id))
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        key = (id, depth, selected)
+        body = tree_cache.get(user.id, key)
+        if body is None:
+            tree = await Page.tree_nodes(
+                session, root_id=id, max_depth=depth, author_id=user.id, fields=selected
+            )
+            body = encode_json(tree)
+            if tree:
+                path = None
+                if id is not None:
+                    path = await session.scalar(select(Page.path).where(Page.id == id))
+                tree_cache.put(user.id, key, path, body, generation)
+        return RawJSONResponse(body, headers={ETAG_HEADER: etag})
+
+    @get("/tree/cache")
+    async def get_tree_cache_stats(self) -> TreeCacheStats:
+        return tree_cache.stats()
 
     @put("/move/{id:int}")
     async def move_page(
-        self, id: int, parent_id: int, session: AsyncSession, user: User
-    ) -> PageOutDTO:
+        self,
+        request: Request,
+        id: int,
+        parent_id: int,
+        session: AsyncSession,
+        user: UserOutDTO,
+        after_id: int | None = None,
+        before_id: int | None = None,
+    ) -> Response[PageOutDTO]:
+        # Moving under the current parent reorders; with neither after_id
+        # nor before_id the page goes last.
         page_to_move = await session.get(Page, id)
+        if page_to_move is None or page_to_move.author_id != user.id:
+            raise NotFoundException()
+        await _lock_page(request, session, page_to_move)
         parent_page = await session.get(Page, parent_id)
-        if (
-            page_to_move is None
-            or parent_page is None
-            or page_to_move.author_id != user.id
-            or parent_page.author_id != user.id
-        ):
+        if parent_page is None or parent_page.author_id != user.id:
             raise NotFoundException()
 
-        if await page_to_move.is_ancestor_of(parent_page, session):
+        if page_to_move.id == parent_page.id or await page_to_move.is_ancestor_of(
+            parent_page, session
+        ):
             raise HTTPException(
                 status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="Cannot move a page to its descandant",
             )
 
+        try:
+            rank = await Page.rank_for(session, user.id, parent_page.id, after_id, before_id)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+            )
+
+        invalidate_tree(session, user.id, page_to_move.path, subtree=True)
+        await _update_path(session, page_to_move, parent_page, page_to_move.title)
         page_to_move.parent_id = parent_page.id
+        page_to_move.rank = rank
+        page_to_move.revision += 1
+        invalidate_tree(session, user.id, page_to_move.path)
+        await resolve_links(session, user.id, page_to_move.path)
+        record_change(
+            session,
+            user.id,
+            page_to_move.id,
+            "moved",
+            parent_id=parent_page.id,
+            rank=rank,
+            revision=page_to_move.revision,
+        )
 
         await session.commit()
         await session.refresh(page_to_move)
 
-        return page_to_move
+        return Response(
+            PageOutDTO.from_model_instance(page_to_move),
+            headers={ETAG_HEADER: page_to_move.etag},
+        )
 
-    @get("/{id:int}")
+    @get("/{id:int}", dependencies=read_only_session)
     async def get_page(
-        self, id: int, session: AsyncSession, user: User, versions_back: int = 0
-    ) -> PageOutDTO:
+        self,
+        request: Request,
+        id: int,
+        session: AsyncSession,
+        user: UserOutDTO,
+        versions_back: int = 0,
+    ) -> Response[PageOutDTO]:
         if versions_back > 0:
             result_scalars = await session.scalars(
                 select(PageVersion)
@@ -146,114 +448,336 @@ class PagesController(Controller):
             )
             result = result_scalars.first()
             if result is not None:
-                return result
+                # Versions never change, so their id is enough of an ETag.
+                etag = f'"v{result.id}"'
+                not_modified = _not_modified(request, etag)
+                if not_modified is not None:
+                    return not_modified
+                contents = await PageVersion.load_contents(session, [result])
+                dto = PageOutDTO(
+                    id=result.id,
+                    title=result.title,
+                    friendly_title=result.friendly_title,
+                    content=contents[result.id],
+                )
+                return Response(dto, headers={ETAG_HEADER: etag})
             logger.warning(f"Did not find version {versions_back} back from current")
         # If version is not set, or is not accessible, fall back to current version.
+        if request.headers.get("if-none-match"):
+            # Check the revision alone before loading the content.
+            revision = await session.scalar(
+                select(Page.revision).where((Page.id == id) & (Page.author_id == user.id))
+            )
+            if revision is not None:
+                not_modified = _not_modified(request, f'"{id}-{revision}"')
+                if not_modified is not None:
+                    return not_modified
         page = await session.get(Page, id)
         if page is None or page.author_id != user.id:
             raise NotFoundException()
-        return page
+        return Response(PageOutDTO.from_model_instance(page), headers={ETAG_HEADER: page.etag})
 
     @put("/{id:int}")
     async def update_page(
         self,
+        request: Request,
         id: int,
         data: Partial[PageInDTO],
         session: AsyncSession,
-        user: User,
+        user: UserOutDTO,
         save_version: bool = False,
-    ) -> PageOutDTO:
+    ) -> Response[PageOutDTO]:
         page = await session.get(Page, id)
         if page is None or page.author_id != user.id:
             raise NotFoundException()
+        await _lock_page(request, session, page)
 
         if save_version:
-            old_version = PageVersion.from_page(page)
+            old_version = await PageVersion.from_page(page, session)
             session.add(old_version)
 
-        for attr, val in data.dict(exclude_unset=True).items():
+        changes = data.dict(exclude_unset=True)
+        if changes.get("title"):
+            _check_title(changes["title"])
+        moved = "title" in changes or "parent_id" in changes
+        if changes:
+            invalidate_tree(session, user.id, page.path, subtree=moved)
+        if moved:
+            parent_id = changes.get("parent_id", page.parent_id)
+            parent_page = None
+            if parent_id is not None:
+                parent_page = await session.get(Page, parent_id)
+                if parent_page is None or parent_page.author_id != user.id:
+                    raise HTTPException(
+                        status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail="Parent ID does not exist",
+                    )
+                if parent_page.id == page.id or await page.is_ancestor_of(
+                    parent_page, session
+                ):
+                    raise HTTPException(
+                        status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail="Cannot move a page to its descandant",
+                    )
+            await _update_path(
+                session, page, parent_page, changes.get("title") or page.title
+            )
+            invalidate_tree(session, user.id, page.path)
+
+        if changes.get("parent_id", page.parent_id) != page.parent_id:
+            page.rank = await Page.rank_for(session, user.id, changes["parent_id"])
+        for attr, val in changes.items():
             setattr(page, attr, val)
+        if changes:
+            page.revision += 1
+        if "content" in changes:
+            await update_links(session, page)
+        if moved:
+            await resolve_links(session, user.id, page.path)
+        if changes:
+            # Only the small fields carry their new values; see ludo.pages.changes.
+            record_change(
+                session,
+                user.id,
+                page.id,
+                "updated",
+                changed=sorted(changes),
+                revision=page.revision,
+                **{name: value for name, value in changes.items() if name != "content"},
+            )
 
         await session.commit()
         await session.refresh(page)
 
-        return page
+        return Response(PageOutDTO.from_model_instance(page), headers={ETAG_HEADER: page.etag})
+
+    @patch("/{id:int}")
+    async def patch_page(
+        self,
+        id: int,
+        data: PagePatch,
+        session: AsyncSession,
+        user: UserOutDTO,
+        save_version: bool = False,
+    ) -> Response[PageRevision]:
+        # Edits content by splices rather than a whole new body, so saving
+        # a small change to a big page sends a small request.
+        page = await session.get(Page, id)
+        if page is None or page.author_id != user.id:
+            raise NotFoundException()
+        await page.lock(session)
+        if page.revision != data.base_revision:
+            raise HTTPException(
+                status_code=status_codes.HTTP_409_CONFLICT,
+                detail="Page has changed since the base revision",
+            )
+        try:
+            content = delta.splice(
+                page.content, ((s.start, s.end, s.text) for s in data.splices)
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+            )
+
+        if save_version:
+            session.add(await PageVersion.from_page(page, session))
+        if content != page.content:
+            page.content = content
+            page.revision += 1
+            await update_links(session, page)
+            record_change(
+                session, user.id, page.id, "updated", changed=["content"], revision=page.revision
+            )
+            invalidate_tree(session, user.id, page.path)
+
+        await session.commit()
+        await session.refresh(page)
+        return Response(
+            PageRevision(id=page.id, revision=page.revision),
+            headers={ETAG_HEADER: page.etag},
+        )
 
-    @get("/{id:int}/versions")
+    @get("/{id:int}/versions", dependencies=read_only_session)
     async def get_versions(
-        self, id: int, session: AsyncSession
-    ) -> list[PageVersionDTO]:
-        result = await session.scalars(
+        self,
+        request: Request,
+        id: int,
+        session: AsyncSession,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> Response[list[PageVersionDTO]]:
+        # Versions are only ever added or dropped, never edited, so their
+        # count and newest id identify the list.
+        count, newest = (
+            await session.execute(
+                select(func.count(), func.max(PageVersion.id)).where(PageVersion.page_id == id)
+            )
+        ).one()
+        etag = f'"{id}-v{count}-{newest or 0}"'
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        stmt = (
             select(PageVersion)
             .where(PageVersion.page_id == id)
-            .order_by(PageVersion.created.desc())
+            .order_by(PageVersion.created.desc(), PageVersion.id.desc())
+            .limit(limit + 1)
         )
-        return result.all()
+        if cursor is not None:
+            created, last_id = decode_cursor(cursor, "created", "id")
+            try:
+                created = datetime.fromisoformat(created)
+            except (TypeError, ValueError):
+                raise ValidationException(detail="Invalid pagination cursor")
+            stmt = stmt.where(
+                tuple_(PageVersion.created, PageVersion.id) < tuple_(created, last_id)
+            )
+
+        versions = (await session.scalars(stmt)).all()
+        contents = await PageVersion.load_contents(session, versions[:limit])
+        return _paginated(
+            versions,
+            limit,
+            lambda version: version.to_dict(contents[version.id]),
+            lambda version: encode_cursor(
+                created=version.created.isoformat(), id=version.id
+            ),
+            etag,
+        )
+
+    @get("/{id:int}/diff", dependencies=read_only_session)
+    async def get_diff(
+        self,
+        request: Request,
+        id: int,
+        session: AsyncSession,
+        user: UserOutDTO,
+        from_id: int = Parameter(query="from"),
+        to_id: int | None = Parameter(query="to", default=None),
+        mode: str = "line",
+        context: int = 3,
+    ) -> Response[PageDiff]:
+        # From one version to another, or to the current page when `to` is
+        # left out. `context` is in lines or words, per `mode`; -1 keeps all
+        # unchanged text.
+        if mode not in MODES:
+            raise ValidationException(detail=f"mode must be one of {', '.join(MODES)}")
+        page_revision = await session.scalar(
+            select(Page.revision).where((Page.id == id) & (Page.author_id == user.id))
+        )
+        if page_revision is None:
+            raise NotFoundException()
+        version_ids = {from_id} if to_id is None else {from_id, to_id}
+        of_page = PageVersion.id.in_(version_ids) & (PageVersion.page_id == id)
+        if await session.scalar(select(func.count()).where(of_page)) != len(version_ids):
+            raise NotFoundException()
+
+        revision = page_revision if to_id is None else None
+        if to_id is None:
+            etag = f'"d{from_id}-{id}-{revision}-{mode}-{context}"'
+        else:
+            etag = f'"d{from_id}-{to_id}-{mode}-{context}"'
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        key = (from_id, to_id, revision, mode, context)
+        body = version_diffs.get(key)
+        if body is None:
+            versions = (await session.scalars(select(PageVersion).where(of_page))).all()
+            contents = await PageVersion.load_contents(session, versions)
+            if to_id is None:
+                new = await session.scalar(select(Page.content).where(Page.id == id))
+            else:
+                new = contents[to_id]
+            ops = await compute_diff(contents[from_id], new, mode, context)
+            body = encode_json({"from_id": from_id, "to_id": to_id, "mode": mode, "ops": ops})
+            version_diffs.set(key, body)
+        return RawJSONResponse(body, headers={ETAG_HEADER: etag})
 
     @delete("/{id:int}/versions/drop")
     async def drop_versions(
         self, id: int, session: AsyncSession, keep: int = 1
     ) -> None:
-        result = await session.scalars(
-            select(PageVersion)
-            .where(PageVersion.page_id == id)
-            .order_by(PageVersion.created.desc())
-            .offset(keep)
-        )
-        for version in result.all():
-            await session.delete(version)
-
+        await PageVersion.prune(session, id, keep)
         await session.commit()
 
     @delete("/{id:int}")
     async def delete_page(
-        self, id: int, session: AsyncSession, user: User, force: bool = False
+        self, id: int, session: AsyncSession, user: UserOutDTO, force: bool = False
     ) -> None:
         page = await session.get(Page, id)
         if page is None or page.author_id != user.id:
             raise NotFoundException()
 
-        # Check for children
-        children = await session.scalars(select(Page).where(Page.parent_id == id))
-        if children.first() is not None and not force:
+        # Check for children; with force they are deleted along with the page.
+        has_children = await session.scalar(select(exists().where(Page.parent_id == id)))
+        if has_children and not force:
             raise HTTPException(
                 status_code=status_codes.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="Attempting to delete page with children",
             )
 
-        result = await session.scalars(
-            select(PageVersion).where(PageVersion.page_id == page.id)
-        )
-        versions_to_delete = result.all()
-
-        for version in versions_to_delete:
-            await session.delete(version)
-
-        await session.delete(page)
+        await record_changes(session, user.id, page.subtree_ids(), "deleted")
+        invalidate_tree(session, user.id, page.path, subtree=True)
+        await unlink_pages(session, page.subtree_ids())
+        await page.delete_subtree(session)
         await session.commit()
 
-    @get("/by-path/{path:path}")
+    @get("/by-path/{path:path}", dependencies=read_only_session)
     async def get_page_by_path(
-        self, path: Path, session: AsyncSession, user: User
+        self, path: Path, session: AsyncSession, user: UserOutDTO
     ) -> PageOutDTO:
-        parent_id = None
-        page = None
-        for part in path.parts[1:]:
-            page = await session.scalar(
-                select(Page).where((Page.title == part) & (Page.parent_id == parent_id))
-            )
-
-            if page is None or page.author_id != user.id:
-                raise NotFoundException()
-
-            parent_id = page.id
-
+        page = await session.scalar(
+            select(Page).where((Page.author_id == user.id) & (Page.path == str(path)))
+        )
         if page is None:
             raise NotFoundException()
 
         return page
 
-    @get("/{id:int}/path")
+    @get("/{id:int}/backlinks", dependencies=read_only_session)
+    async def get_backlinks(
+        self,
+        id: int,
+        session: AsyncSession,
+        user: UserOutDTO,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> Response[list[Backlink]]:
+        # Pages whose content links to this one.
+        stmt = backlinks(user.id, id).limit(limit + 1)
+        if cursor is not None:
+            (last_id,) = decode_cursor(cursor, "id")
+            stmt = stmt.where(PageLink.source_id > last_id)
+        rows = (await session.execute(stmt)).all()
+        return _paginated(rows, limit, Row._asdict, lambda row: encode_cursor(id=row.id))
+
+    @get("/links/broken", dependencies=read_only_session)
+    async def get_broken_links(
+        self,
+        session: AsyncSession,
+        user: UserOutDTO,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> Response[list[BrokenLink]]:
+        stmt = broken_links(user.id).limit(limit + 1)
+        if cursor is not None:
+            target_path, source_id = decode_cursor(cursor, "target_path", "source_id")
+            stmt = stmt.where(
+                tuple_(PageLink.target_path, PageLink.source_id) > tuple_(target_path, source_id)
+            )
+        rows = (await session.execute(stmt)).all()
+        return _paginated(
+            rows,
+            limit,
+            Row._asdict,
+            lambda row: encode_cursor(target_path=row.target_path, source_id=row.source_id),
+        )
+
+    @get("/{id:int}/path", dependencies=read_only_session)
     async def get_page_path(self, id: int, session: AsyncSession) -> Path:
         page = await session.get(Page, id)
         if page is None:
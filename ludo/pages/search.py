@@ -0,0 +1,128 @@
+"""Full-text search over pages, backed by an SQLite FTS5 table.
+
+`page_fts` is an external-content index over `page`, kept current by
+triggers. To rebuild it for an existing database, run:
+
+    python -m ludo.pages.search
+"""
+import asyncio
+
+from sqlalchemy import Connection, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ludo.db import sqlalchemy_config
+
+
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS page_fts USING fts5(
+        title, friendly_title, content,
+        content='page', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_fts_insert AFTER INSERT ON page BEGIN
+        INSERT INTO page_fts (rowid, title, friendly_title, content)
+        VALUES (new.id, new.title, new.friendly_title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_fts_delete AFTER DELETE ON page BEGIN
+        INSERT INTO page_fts (page_fts, rowid, title, friendly_title, content)
+        VALUES ('delete', old.id, old.title, old.friendly_title, old.content);
+    END
+    """,
+    # Only the indexed columns: path rewrites on moves don't touch the index.
+    """
+    CREATE TRIGGER IF NOT EXISTS page_fts_update
+    AFTER UPDATE OF title, friendly_title, content ON page BEGIN
+        INSERT INTO page_fts (page_fts, rowid, title, friendly_title, content)
+        VALUES ('delete', old.id, old.title, old.friendly_title, old.content);
+        INSERT INTO page_fts (rowid, title, friendly_title, content)
+        VALUES (new.id, new.title, new.friendly_title, new.content);
+    END
+    """,
+]
+
+# Titles weigh more than body text in the ranking.
+SEARCH = """
+    SELECT page.id, page.title, page.friendly_title, page.parent_id,
+           snippet(page_fts, -1, :open, :close, '…', 16) AS snippet,
+           bm25(page_fts, 10.0, 10.0, 1.0) AS score
+    FROM page_fts JOIN page ON page.id = page_fts.rowid
+    WHERE page_fts MATCH :query AND page.author_id = :author_id
+      AND (bm25(page_fts, 10.0, 10.0, 1.0), page.id) > (:after_score, :after_id)
+    ORDER BY score, page.id
+    LIMIT :limit
+"""
+
+
+def create_search_index(connection: Connection) -> bool:
+    # Returns True if the index had to be created and so needs a rebuild.
+    created = not inspect(connection).has_table("page_fts")
+    for statement in CREATE_INDEX:
+        connection.execute(text(statement))
+    return created
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    connection.execute(text("INSERT INTO page_fts (page_fts) VALUES ('rebuild')"))
+
+
+def to_match_query(query: str) -> str:
+    # Quote every term so user input can't be parsed as FTS5 syntax. Terms
+    # are ANDed together, and a trailing `*` still does a prefix match.
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+async def search_pages(
+    session: AsyncSession,
+    author_id: int,
+    query: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+):
+    match = to_match_query(query)
+    if not match:
+        # Nothing but `*`s: no terms, and FTS5 rejects an empty MATCH.
+        return []
+    after_score, after_id = after if after is not None else (float("-inf"), 0)
+    result = await session.execute(
+        text(SEARCH),
+        {
+            "open": SNIPPET_OPEN,
+            "close": SNIPPET_CLOSE,
+            "query": match,
+            "author_id": author_id,
+            "after_score": after_score,
+            "after_id": after_id,
+            "limit": limit,
+        },
+    )
+    return result.all()
+
+
+async def search_on_startup() -> None:
+    async with sqlalchemy_config.engine.begin() as conn:
+        if await conn.run_sync(create_search_index):
+            await conn.run_sync(rebuild_search_index)
+
+
+async def main() -> None:
+    async with sqlalchemy_config.engine.begin() as conn:
+        await conn.run_sync(create_search_index)
+        await conn.run_sync(rebuild_search_index)
+    await sqlalchemy_config.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ludo import metrics
+from ludo.settings import settings
+
+
+# Rough cost of an entry beyond its body: key, bookkeeping and dict slots.
+ENTRY_OVERHEAD = 200
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    # Path of the subtree's root page, or None for the whole forest.
+    path: str | None
+
+
+class TreeCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    size: int
+    max_size: int
+
+
+class TreeCache:
+    """Serialized trees per user and request, least recently used first.
+
+    Keys identify a tree within a user's pages: its root and whatever else
+    shapes the response, such as depth and fields.
+
+    Writes invalidate by materialized path: changing a page drops the
+    cached trees rooted at it or at one of its ancestors, and moving or
+    deleting it also drops those rooted inside its subtree.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.size = 0
+        self._entries: OrderedDict[tuple[int, Hashable], _Entry] = OrderedDict()
+        self._keys: dict[int, set[Hashable]] = {}
+        self._generations: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self, user_id: int) -> int:
+        # Taken before reading a tree, and handed back to `put`, so a tree
+        # read before a write committed can't be stored after it.
+        return self._generations.get(user_id, 0)
+
+    def get(self, user_id: int, key: Hashable) -> bytes | None:
+        entry = self._entries.get((user_id, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end((user_id, key))
+        return entry.body
+
+    def put(
+        self,
+        user_id: int,
+        key: Hashable,
+        path: str | None,
+        body: bytes,
+        generation: int,
+    ) -> None:
+        if generation != self.generation(user_id):
+            return
+        cost = len(body) + ENTRY_OVERHEAD
+        if cost > self.max_size:
+            return
+        self._remove((user_id, key))
+        self._entries[(user_id, key)] = _Entry(body, path)
+        self._keys.setdefault(user_id, set()).add(key)
+        self.size += cost
+        while self.size > self.max_size:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int, path: str | None, subtree: bool = False) -> None:
+        # A path of None drops every tree of the user.
+        self._generations[user_id] = self.generation(user_id) + 1
+        for key in list(self._keys.get(user_id, ())):
+            root_path = self._entries[(user_id, key)].path
+            if (
+                path is None
+                or root_path is None
+                or path == root_path
+                or path.startswith(root_path + "/")
+                or (subtree and root_path.startswith(path + "/"))
+            ):
+                self._remove((user_id, key))
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys.clear()
+        self._generations.clear()
+        self.size = 0
+
+    def stats(self) -> TreeCacheStats:
+        return TreeCacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            invalidations=self.invalidations,
+            entries=len(self._entries),
+            size=self.size,
+            max_size=self.max_size,
+        )
+
+    def _remove(self, entry_key: tuple[int, Hashable]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body) + ENTRY_OVERHEAD
+        user_id, key = entry_key
+        keys = self._keys[user_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys[user_id]
+
+
+tree_cache = TreeCache(max_size=settings.tree_cache_max_size)
+
+
+def _collect_metrics() -> list[str]:
+    stats = tree_cache.stats()
+    lines = []
+    for name, kind, value in (
+        ("hits_total", "counter", stats.hits),
+        ("misses_total", "counter", stats.misses),
+        ("evictions_total", "counter", stats.evictions),
+        ("invalidations_total", "counter", stats.invalidations),
+        ("entries", "gauge", stats.entries),
+        ("bytes", "gauge", stats.size),
+    ):
+        lines += [f"# TYPE ludo_tree_cache_{name} {kind}", f"ludo_tree_cache_{name} {value}"]
+    return lines
+
+
+metrics.collectors.append(_collect_metrics)
+
+
+def invalidate_tree(
+    session: AsyncSession, user_id: int, path: str | None, subtree: bool = False
+) -> None:
+    # Applied once the session commits; readers that start after that see
+    # the write, and readers that started before it can't store their tree.
+    session.info.setdefault("stale_trees", []).append((user_id, path, subtree))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_trees(session: Session) -> None:
+    for user_id, path, subtree in session.info.pop("stale_trees", ()):
+        tree_cache.invalidate(user_id, path, subtree)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_trees(session: Session) -> None:
+    session.info.pop("stale_trees", None)
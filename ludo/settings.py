@@ -0,0 +1,55 @@
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    # Password hashing runs on this many threads; once this many hashes are
+    # running or waiting, further logins are turned away with a 503.
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 16
+
+    database_url: str = "sqlite+aiosqlite:///db.sqlite"
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    # GET handlers read through a separate pool of query-only connections;
+    # under WAL those never wait on, or hold up, a writer.
+    database_read_engine: bool = True
+    database_read_pool_size: int = 10
+    # Applied to every new connection. cache_size is in pages, or KiB when
+    # negative; busy_timeout is in milliseconds.
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_cache_size: int = -20_000
+    sqlite_mmap_size: int = 0
+    sqlite_busy_timeout: int = 5_000
+
+    # Bytes of serialized page trees kept in memory; 0 turns the cache off.
+    # Invalidation is in process, so run one worker process or turn it off.
+    tree_cache_max_size: int = 32 * 1024 * 1024
+
+    # Statements slower than this are logged and counted in /metrics.
+    metrics_slow_statement_ms: float = 100
+
+    # Old page versions are thinned in the background, every interval
+    # seconds; see ludo.pages.retention for the policy format. An empty
+    # policy keeps every version.
+    version_retention: str = "1d:all,7d:1h,*:1d"
+    version_retention_interval: float = 60 * 60
+    # Versions deleted per transaction.
+    version_retention_batch_size: int = 200
+    # Change feed entries older than this many seconds are trimmed on the
+    # same schedule, in batches of version_retention_batch_size; 0 keeps
+    # them all.
+    change_retention: float = 30 * 24 * 60 * 60
+
+    # Diffs between versions are cached, this many at a time. Diffs of
+    # contents larger than diff_inline_max_size characters in total are
+    # computed on diff_workers threads rather than on the event loop.
+    diff_cache_size: int = 256
+    diff_inline_max_size: int = 16 * 1024
+    diff_workers: int = 2
+
+    class Config:
+        env_prefix = "LUDO_"
+
+
+settings = Settings()
@@ -1,25 +1,217 @@
+import asyncio
+import base64
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 from pathlib import Path
 import pickle
-from typing import Any
-from starlite.config.cache import SimpleCacheBackend
+import sqlite3
+import time
+from typing import Any, Callable, Generic, Hashable, TypeVar
+from starlite import Response, ValidationException
+from starlite.cache.base import CacheBackendProtocol
 
 
-class PicklingCacheBackend(SimpleCacheBackend):
-    def __init__(self, path: os.PathLike) -> None:
-        super().__init__()
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class RawJSONResponse(Response):
+    # For content that is already encoded, such as a cached body.
+    def render(self, content: Any) -> bytes:
+        return content
+
+
+def encode_cursor(**values: Any) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *keys: str) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return [values[key] for key in keys]
+    except (ValueError, TypeError, KeyError):
+        raise ValidationException(detail="Invalid pagination cursor")
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    # `header` is an If-None-Match (weak comparison) or If-Match (strong
+    # comparison) value: "*" or a comma separated list of entity tags.
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class SQLiteCacheBackend(CacheBackendProtocol):
+    """Persistent cache storing one row per key in a SQLite file.
+
+    File I/O runs on a single worker thread, entries are loaded on first
+    access, and the least recently used ones are evicted past `max_size`.
+    """
+
+    def __init__(
+        self, path: os.PathLike, max_size: int = 10_000, sweep_interval: int = 60 * 60
+    ) -> None:
         self.path = Path(path)
-        if self.path.exists():
-            self._store = pickle.loads(self.path.read_bytes())
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self._memory: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        # Access times of memory hits, flushed to disk with the next write so
+        # reads stay free of I/O while LRU order still survives restarts.
+        self._touched: dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+        self._conn: sqlite3.Connection | None = None
+        self._size = 0
+        self._next_sweep = 0.0
+
+    async def get(self, key: str) -> Any:
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = await self._run(self._read, key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
 
-    async def write_to_disk(self):
-        async with self._lock:
-            self.path.write_bytes(pickle.dumps(self._store))
+        value, expires = entry
+        now = time.time()
+        if expires < now:
+            await self.delete(key)
+            return None
+        self._memory.move_to_end(key)
+        self._touched[key] = now
+        return value
 
     async def set(self, key: str, value: Any, expiration: int) -> None:
-        await super().set(key, value, expiration)
-        await self.write_to_disk()
+        expires = time.time() + expiration
+        self._remember(key, (value, expires))
+        self._touched.pop(key, None)
+        touched, self._touched = self._touched, {}
+        await self._run(self._write, key, pickle.dumps(value), expires, touched)
 
     async def delete(self, key: str) -> None:
-        await super().delete(key)
-        await self.write_to_disk()
+        self._memory.pop(key, None)
+        self._touched.pop(key, None)
+        await self._run(self._delete, key)
+
+    def _remember(self, key: str, entry: tuple[Any, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # Everything below runs on the worker thread.
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires ON cache (expires)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)")
+            self._size = conn.execute("SELECT count(*) FROM cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _read(self, key: str) -> tuple[Any, float] | None:
+        row = (
+            self._connect()
+            .execute("SELECT value, expires FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def _write(
+        self, key: str, value: bytes, expires: float, touched: dict[str, float]
+    ) -> None:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN")
+            exists = conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                "expires = excluded.expires, accessed = excluded.accessed",
+                (key, value, expires, now),
+            )
+            if exists is None:
+                self._size += 1
+            if touched:
+                conn.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?",
+                    [(accessed, k) for k, accessed in touched.items()],
+                )
+            if now >= self._next_sweep:
+                cursor = conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+                self._size -= cursor.rowcount
+                self._next_sweep = now + self.sweep_interval
+            if self._size > self.max_size:
+                cursor = conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (self._size - self.max_size,),
+                )
+                self._size -= cursor.rowcount
+
+    def _delete(self, key: str) -> None:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._size -= cursor.rowcount